@@ -1,8 +1,37 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 from datetime import datetime
-import io
+import json
+import math
+import functools
+from functools import partial
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from charts import (evolution_series, fig_evolution, fig_monthly_results, fig_positivity_trends, fig_resultados,
+                    fig_sampling_map, fig_tipos, fig_top_wellboats, monthly_results, positivity_trends,
+                    top_wellboats)
+from cube import (CUBE_DIMENSIONS, DATE_COLUMN, build_cube, cube_counts, cube_daily, cube_total, facet_counts,
+                  facet_cube, slice_cube)
+from dataset_cache import DatasetCache
+from excel_reader import workbook_sheets
+from export import EXPORT_FORMATS, export_query, export_rows
+from filter_index import FilterIndex
+from folio_index import FolioIndex
+from geo import (GRID_STEPS, LAT_COLUMN, LON_COLUMN, SpatialIndex, auto_grid_step, bin_samples, coordinates,
+                 map_view, outer_bounds)
+from history_store import history_key, load_history, load_history_cube, merge_into_history, read_manifest
+from ingest import REQUIRED_COLUMNS, compact_frame, frame_memory_mb, iter_csv_chunks
+from ingest_jobs import JOB_DONE, JOB_FAILED, JOB_RUNNING, IngestJobs
+from parallel_ingest import create_pool, load_sources, sources_key
+from lru import LRUCache
+from precompute import dataset_stats, read_cube, read_published, read_stats
+from profiling import PROFILE_LOG, StageProfiler, profiling_requested
+from snapshot_cache import content_hash, read_snapshot, snapshot_path, write_snapshot
+from sql_backend import SQLBackend, build_database, sql_backend_requested, sql_path
+from table_view import PAGE_SIZES, SortOrder, page_bounds, search_rows
+from timeseries import RESOLUTIONS
+from trends import ALERT_THRESHOLD, MIN_WINDOW_SAMPLES, TREND_WINDOWS, daily_positivity, risk_table
 
 # -----------------------------------------------------------------------------
 # CONFIGURACIÓN DE PÁGINA
@@ -28,476 +57,1159 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Perfilado opcional de etapas (?perfil=1 o MUESTREO_PROFILE=1)
+profiler = StageProfiler(profiling_requested(st.query_params))
+
+
+def profiled_fragment(func):
+    # Las re-ejecuciones sólo del fragmento no pasan por el final del script:
+    # sus etapas se escriben al terminar el fragmento
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        ctx = get_script_run_ctx()
+        with profiler.fragment_run(func.__name__, bool(ctx is not None and ctx.fragment_ids_this_run)):
+            return func(*args, **kwargs)
+    return run
+
+
 st.title("🚢 Dashboard de Muestreo Wellboat (2016-2025)")
 st.markdown("---")
 
 # -----------------------------------------------------------------------------
 # FUNCIÓN PARA CARGAR DATOS DEL ARCHIVO EXCEL
 # -----------------------------------------------------------------------------
-@st.cache_data
-def load_data(uploaded_file=None):
-    if uploaded_file is not None:
-        try:
-            # DEBUG: Mostrar información del archivo
-            st.sidebar.info(f"📄 Archivo: {uploaded_file.name}")
-            st.sidebar.info(f"📏 Tamaño: {uploaded_file.size / 1024:.1f} KB")
-            
-            # Leer el archivo basado en su extensión
-            file_extension = uploaded_file.name.split('.')[-1].lower()
-            
-            if file_extension in ['xlsx', 'xls']:
-                # Leer Excel
-                df = pd.read_excel(uploaded_file, engine='openpyxl')
-                
-                # DEBUG: Mostrar información de hojas
-                excel_file = pd.ExcelFile(uploaded_file, engine='openpyxl')
-                st.sidebar.info(f"📑 Hojas disponibles: {excel_file.sheet_names}")
-                
-                # Si hay múltiples hojas, usar la primera
-                if len(excel_file.sheet_names) > 1:
-                    st.sidebar.warning(f"Usando la hoja: '{excel_file.sheet_names[0]}'")
-                    
-            elif file_extension == 'csv':
-                # Leer CSV
-                df = pd.read_csv(uploaded_file)
-            else:
-                st.error(f"Formato no soportado: {file_extension}")
-                return pd.DataFrame()
-            
-            # DEBUG: Mostrar información del DataFrame
-            st.sidebar.success(f"✅ Datos cargados: {len(df)} filas, {len(df.columns)} columnas")
-            st.sidebar.info(f"📋 Columnas: {list(df.columns)}")
-            
-            # Mostrar primeras filas para depuración
-            with st.expander("🔍 Vista previa de datos (primeras 5 filas)", expanded=False):
-                st.dataframe(df.head())
-            
-            # Verificar si el DataFrame está vacío
-            if df.empty:
-                st.error("⚠️ El DataFrame está vacío. Revisa el formato del archivo.")
-                return df
-            
-            # Mostrar información de tipos de datos
-            with st.expander("📊 Información de tipos de datos", expanded=False):
-                buffer = io.StringIO()
-                df.info(buf=buffer)
-                st.text(buffer.getvalue())
-            
-            # Normalizar nombres de columnas (eliminar espacios extra, poner mayúsculas)
-            df.columns = df.columns.str.strip()
-            
-            # Verificar columnas críticas
-            required_columns = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'RESULTADO']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                st.error(f"⚠️ Faltan columnas críticas: {missing_columns}")
-                st.warning(f"Columnas disponibles: {list(df.columns)}")
-                
-                # Intentar encontrar columnas con nombres similares
-                for missing_col in missing_columns:
-                    similar_cols = [col for col in df.columns if missing_col.lower() in col.lower()]
-                    if similar_cols:
-                        st.info(f"Columnas similares a '{missing_col}': {similar_cols}")
-            
-            # Convertir fecha a datetime (manejar diferentes formatos)
-            if 'FECHA MUESTREO' in df.columns:
-                try:
-                    df['FECHA MUESTREO'] = pd.to_datetime(df['FECHA MUESTREO'], errors='coerce')
-                    
-                    # Verificar cuántas fechas se convirtieron correctamente
-                    valid_dates = df['FECHA MUESTREO'].notna().sum()
-                    st.sidebar.info(f"📅 Fechas válidas: {valid_dates}/{len(df)}")
-                    
-                    if valid_dates == 0:
-                        st.warning("No se pudieron convertir las fechas. Verifica el formato.")
-                        
-                        # Mostrar ejemplos de fechas problemáticas
-                        date_samples = df['FECHA MUESTREO'].head().astype(str).tolist()
-                        st.write(f"Ejemplos de fechas: {date_samples}")
-                except Exception as e:
-                    st.error(f"Error al convertir fechas: {e}")
-            
-            # Crear columna de mes-año para agrupaciones
-            if 'FECHA MUESTREO' in df.columns and df['FECHA MUESTREO'].notna().any():
-                df['MES_NOMBRE'] = df['FECHA MUESTREO'].dt.strftime('%B %Y')
-            
-            # Normalizar resultados (mayúsculas/minúsculas)
-            if 'RESULTADO' in df.columns:
-                df['RESULTADO'] = df['RESULTADO'].astype(str).str.strip().str.upper()
-                
-                # Mostrar distribución de resultados
-                result_counts = df['RESULTADO'].value_counts()
-                st.sidebar.info(f"📊 Resultados: {dict(result_counts)}")
-            
-            # Normalizar tipo de muestreo
-            if 'TIPO MUESTREO' in df.columns:
-                df['TIPO MUESTREO'] = df['TIPO MUESTREO'].astype(str).str.strip().str.upper()
-            
-            # Rellenar valores NaN en columnas críticas
-            if 'WELLBOAT' in df.columns:
-                df['WELLBOAT'] = df['WELLBOAT'].fillna('NO ESPECIFICADO')
-                
-                # Mostrar wellboats únicos
-                unique_wellboats = df['WELLBOAT'].nunique()
-                st.sidebar.info(f"🚢 Wellboats únicos: {unique_wellboats}")
-            
-            # Extraer año, mes, día si existen las columnas separadas
-            if 'AÑO' not in df.columns and 'FECHA MUESTREO' in df.columns:
-                df['AÑO'] = df['FECHA MUESTREO'].dt.year
-            if 'MES' not in df.columns and 'FECHA MUESTREO' in df.columns:
-                df['MES'] = df['FECHA MUESTREO'].dt.month
-            if 'DIA' not in df.columns and 'FECHA MUESTREO' in df.columns:
-                df['DIA'] = df['FECHA MUESTREO'].dt.day
-            
-            return df
-            
-        except Exception as e:
-            st.error(f"❌ Error al procesar el archivo: {str(e)}")
-            import traceback
-            st.error(f"Detalles del error: {traceback.format_exc()}")
+@st.cache_resource
+def get_ingest_pool():
+    # Pool de procesos compartido: se crea una vez por servidor
+    return create_pool()
+
+
+@st.cache_data(max_entries=32)
+def get_sheet_names(file_key, _uploaded_file):
+    # Lista de hojas de un libro (modo lectura: no parsea las celdas)
+    return workbook_sheets(_uploaded_file.name, _uploaded_file.getvalue())
+
+
+def source_tasks(sources):
+    # (archivo subido, hoja) -> (nombre, bytes, hoja) para los workers
+    return [(uploaded_file.name, uploaded_file.getvalue(), sheet) for uploaded_file, sheet in sources]
+
+
+def check_structure(df):
+    # Avisos sobre la estructura de los datos; devuelve las columnas críticas faltantes
+    # Verificar si el DataFrame está vacío
+    if df.empty:
+        st.error("⚠️ El DataFrame está vacío. Revisa el formato del archivo.")
+        return list(REQUIRED_COLUMNS)
+    
+    # Verificar columnas críticas
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    
+    if missing_columns:
+        st.error(f"⚠️ Faltan columnas críticas: {missing_columns}")
+        st.warning(f"Columnas disponibles: {list(df.columns)}")
+        
+        # Intentar encontrar columnas con nombres similares
+        for missing_col in missing_columns:
+            similar_cols = [col for col in df.columns if missing_col.lower() in col.lower()]
+            if similar_cols:
+                st.info(f"Columnas similares a '{missing_col}': {similar_cols}")
+    
+    # Verificar que las fechas se hayan podido convertir
+    if 'FECHA MUESTREO' in df.columns and df['FECHA MUESTREO'].notna().sum() == 0:
+        st.warning("No se pudieron convertir las fechas. Verifica el formato.")
+    return missing_columns
+
+
+@st.cache_resource
+def get_dataset_cache():
+    # Datasets compartidos por todas las sesiones, con presupuesto de memoria
+    # (MUESTREO_CACHE_MB) y expiración (MUESTREO_CACHE_TTL); lo desalojado
+    # queda como snapshot y se vuelve a mapear desde disco
+    return DatasetCache()
+
+
+def read_dataset(snapshot_key, sources):
+    # Carga pura, sin widgets: snapshot_key identifica el contenido de sources
+    # (archivos y hojas elegidas). Lo que corre aquí no se repite en un acierto
+    # de la caché, así que los avisos van en load_dataset
+    with profiler.stage('snapshot_lectura', archivos=len(sources)) as info:
+        df = read_snapshot(snapshot_key)
+        info['rows'] = None if df is None else len(df)
+        info['hit'] = df is not None
+    if df is not None:
+        return df
+    
+    # Leer y normalizar cada archivo u hoja en paralelo (un CSV solo se
+    # lee por bloques) y unir con las columnas reconciliadas
+    with profiler.stage('lectura_normalizacion', fuentes=len(sources)) as info:
+        pool = get_ingest_pool() if len(sources) > 1 else None
+        df = load_sources(source_tasks(sources), pool)
+        info['rows'] = len(df)
+    if df.empty:
+        return df
+    
+    # Representación compacta: categorías, enteros pequeños y texto columnar
+    with profiler.stage('compactacion', rows=len(df)) as info:
+        info['memoria_antes_mb'] = round(frame_memory_mb(df), 2)
+        df = compact_frame(df)
+        info['memoria_despues_mb'] = round(frame_memory_mb(df), 2)
+    
+    # Guardar snapshot solo si el archivo tiene la estructura esperada
+    if all(col in df.columns for col in REQUIRED_COLUMNS):
+        with profiler.stage('snapshot_escritura', rows=len(df)) as info:
+            try:
+                write_snapshot(snapshot_key, df)
+                df = read_snapshot(snapshot_key)
+            except Exception as e:
+                info['error'] = str(e)
+    return df
+
+
+def load_dataset(snapshot_key, sources):
+    # Verificar la extensión de cada archivo
+    for uploaded_file, _ in sources:
+        file_extension = uploaded_file.name.split('.')[-1].lower()
+        if file_extension not in ['xlsx', 'xls', 'csv']:
+            st.error(f"Formato no soportado: {file_extension}")
             return pd.DataFrame()
-    else:
-        # Si no hay archivo, mostrar instrucciones
-        st.info("""
-        ### 📋 Instrucciones:
-        1. Usa el panel lateral para subir tu archivo
-        2. Aceptamos formatos: **.xlsx, .xls, .csv**
-        3. El archivo debe contener al menos estas columnas:
-           - FOLIO
-           - FECHA MUESTREO
-           - WELLBOAT
-           - RESULTADO
-           - TIPO MUESTREO
-        """)
+    
+    try:
+        df = get_dataset_cache().get(snapshot_key, partial(read_dataset, snapshot_key, sources))
+    except Exception as e:
+        st.error(f"❌ Error al procesar el archivo: {str(e)}")
+        import traceback
+        st.error(f"Detalles del error: {traceback.format_exc()}")
         return pd.DataFrame()
+    
+    st.success(f"✅ Datos cargados: {len(df)} filas, {len(df.columns)} columnas")
+    # Los avisos se muestran en cada carga, venga o no de la caché
+    missing_columns = check_structure(df)
+    if not df.empty and not missing_columns and not snapshot_path(snapshot_key).exists():
+        st.warning("No se pudo guardar el snapshot: el archivo se volverá a leer tras un reinicio")
+    return df
+
+
+def show_instructions():
+    # Si no hay archivo, mostrar instrucciones
+    st.info("""
+    ### 📋 Instrucciones:
+    1. Usa el panel lateral para subir tu archivo
+    2. Aceptamos formatos: **.xlsx, .xls, .csv**
+    3. El archivo debe contener al menos estas columnas:
+       - FOLIO
+       - FECHA MUESTREO
+       - WELLBOAT
+       - RESULTADO
+       - TIPO MUESTREO
+    """)
+
+# -----------------------------------------------------------------------------
+# KPIs E INGESTA PROGRESIVA DE CSV
+# -----------------------------------------------------------------------------
+def render_kpis(total, wellboats_unicos, positivos, negativos):
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total Muestras", total)
+    
+    with col2:
+        st.metric("Wellboats Únicos", wellboats_unicos)
+    
+    with col3:
+        pct_pos = positivos / total * 100 if total else 0
+        st.metric("Resultados Positivos", positivos, f"{pct_pos:.1f}%")
+    
+    with col4:
+        pct_neg = negativos / total * 100 if total else 0
+        st.metric("Resultados Negativos", negativos, f"{pct_neg:.1f}%")
+
+
+@st.cache_resource
+def get_ingest_jobs():
+    # Trabajos de ingesta en segundo plano, compartidos por todas las sesiones
+    return IngestJobs()
+
+
+def start_ingest_job(sources, dataset_key):
+    # Archivos nuevos (sin snapshot) se leen en segundo plano; None si el
+    # formato no es válido y load_dataset debe mostrar el error
+    if any(f.name.split('.')[-1].lower() not in ['xlsx', 'xls', 'csv'] for f, _ in sources):
+        return None
+    csv_only = len(sources) == 1 and sources[0][0].name.lower().endswith('.csv')
+    return get_ingest_jobs().start(dataset_key, source_tasks(sources), None if csv_only else get_ingest_pool())
+
+
+def cancel_ingest_job(dataset_key):
+    get_ingest_jobs().discard(dataset_key)
+    st.session_state['ingesta_cancelada'] = dataset_key
+
+
+@st.fragment(run_every=1.0)
+def render_ingest_progress(dataset_key):
+    # Se refresca sola cada segundo sin volver a ejecutar la app; al terminar
+    # el trabajo pide una ejecución completa para entregar los datos
+    job = get_ingest_jobs().get(dataset_key)
+    if job is None or job.state != JOB_RUNNING:
+        st.rerun()
+    st.header("📊 Indicadores Clave")
+    st.progress(job.fraction, text=f"⏳ {job.stage} · {job.rows} filas leídas · {job.elapsed:.0f} s")
+    if job.kpis is not None:
+        render_kpis(*job.kpis)
+    st.button("✖️ Cancelar carga", on_click=cancel_ingest_job, args=(dataset_key,), key='cancelar_ingesta')
+
+def get_filter_index(dataset_key, df):
+    # Índice de filtros construido una vez por dataset (clave = hash del
+    # contenido); como los demás índices, vive en la entrada del dataset en
+    # la caché de datasets y se libera con ella
+    def build():
+        with profiler.stage('indice_filtros', rows=len(df)):
+            return FilterIndex(df)
+    return get_dataset_cache().derived(dataset_key, 'indice_filtros', build)
+
+def get_cube(dataset_key, df):
+    # Cubo de conteos día × WELLBOAT × RESULTADO × TIPO MUESTREO, uno por dataset
+    # (el de precompute.py si este contenido ya se precalculó)
+    def build():
+        with profiler.stage('cubo', rows=len(df)) as info:
+            cube = read_cube(dataset_key)
+            info['precalculado'] = cube is not None
+            return build_cube(df) if cube is None else cube
+    return get_dataset_cache().derived(dataset_key, 'cubo', build)
+
+def get_sort_order(dataset_key, df, column):
+    # Orden global de una columna para ordenar páginas de la tabla
+    def build():
+        with profiler.stage('orden_tabla', rows=len(df), columna=column):
+            return SortOrder(df[column])
+    return get_dataset_cache().derived(dataset_key, f"orden_{column}", build)
+
+def get_folio_index(dataset_key, df):
+    # FOLIO normalizados y ordenados para búsquedas exactas y por prefijo
+    def build():
+        with profiler.stage('indice_folio', rows=len(df)):
+            return FolioIndex(df['FOLIO'])
+    return get_dataset_cache().derived(dataset_key, 'indice_folio', build)
+
+def get_spatial_index(dataset_key, df):
+    # Coordenadas y filas por celda para el filtro de zona y el mapa
+    def build():
+        with profiler.stage('indice_espacial', rows=len(df)):
+            return SpatialIndex(*coordinates(df))
+    return get_dataset_cache().derived(dataset_key, 'indice_espacial', build)
+
+def get_dataset_stats(dataset_key, df):
+    # Opciones de filtros y estadísticas globales: se calculan una vez por dataset
+    def build():
+        with profiler.stage('estadisticas_dataset', rows=len(df)) as info:
+            stats = read_stats(dataset_key)
+            info['precalculado'] = stats is not None
+            if stats is None:
+                extent = None
+                if LAT_COLUMN in df.columns and LON_COLUMN in df.columns:
+                    extent = get_spatial_index(dataset_key, df).extent
+                stats = dataset_stats(df, extent)
+            return stats
+    return get_dataset_cache().derived(dataset_key, 'estadisticas', build)
+
+def read_published_frame(dataset_key):
+    with profiler.stage('snapshot_publicado') as info:
+        df = read_snapshot(dataset_key)
+        info['rows'] = None if df is None else len(df)
+        return df
+
+
+def get_published_frame(dataset_key):
+    # Tabla del snapshot publicado por precompute.py (mapeada desde disco, que
+    # ya es su copia: al desalojarla no se vuelve a escribir)
+    return get_dataset_cache().get(dataset_key, partial(read_published_frame, dataset_key), spill=False)
+
+# -----------------------------------------------------------------------------
+# HISTÓRICO INCREMENTAL
+# -----------------------------------------------------------------------------
+def read_history(generation):
+    with profiler.stage('historico_lectura', generacion=generation) as info:
+        history = load_history(read_manifest())
+        info['rows'] = len(history)
+        return history
+
+
+def get_history(generation):
+    # Histórico vigente: la generación cambia con cada fusión. Sus segmentos
+    # ya están en disco, así que no se vuelca al desalojarlo
+    return get_dataset_cache().get(history_key(generation), partial(read_history, generation), spill=False)
+
+def get_history_cube(generation):
+    # Cubo mantenido de forma incremental por merge_into_history
+    return get_dataset_cache().derived(history_key(generation), 'cubo',
+                                       lambda: load_history_cube(read_manifest()))
+
+# -----------------------------------------------------------------------------
+# BACKEND SQL (MUESTREO_BACKEND=sqlite)
+# -----------------------------------------------------------------------------
+@st.cache_resource(max_entries=8)
+def get_sql_backend(dataset_key):
+    return SQLBackend(sql_path(dataset_key))
+
+def get_sql_stats(dataset_key):
+    # La base no tiene DataFrame en la caché de datasets: su entrada guarda
+    # sólo las estadísticas y los cubos
+    def build():
+        with profiler.stage('estadisticas_sql'):
+            return get_sql_backend(dataset_key).stats()
+    return get_dataset_cache().derived(dataset_key, 'estadisticas', build)
+
+def get_sql_cube(dataset_key):
+    # Cubo completo de la base (una consulta GROUP BY), base de los filtros en cascada
+    def build():
+        with profiler.stage('cubo_sql'):
+            return get_sql_backend(dataset_key).cube({})
+    return get_dataset_cache().derived(dataset_key, 'cubo', build)
+
+
+def open_sql_dataset(sources, dataset_key):
+    # La primera vez se vuelcan los archivos a la base por bloques (un CSV solo
+    # nunca queda completo en memoria). Devuelve None si los datos no tienen la
+    # estructura esperada: la carga en memoria muestra entonces los avisos
+    if not sql_path(dataset_key).exists():
+        uploaded_file = sources[0][0]
+        if any(f.name.split('.')[-1].lower() not in ['xlsx', 'xls', 'csv'] for f, _ in sources):
+            return None
+        if len(sources) == 1 and uploaded_file.name.lower().endswith('.csv'):
+            uploaded_file.seek(0)
+            chunks = iter_csv_chunks(uploaded_file)
+        else:
+            pool = get_ingest_pool() if len(sources) > 1 else None
+            chunks = iter([load_sources(source_tasks(sources), pool)])
+        
+        first = next(chunks, None)
+        if first is None or first.empty or not all(col in first.columns for col in REQUIRED_COLUMNS):
+            return None
+        
+        progress = st.sidebar.progress(0.0, text="🗄️ Cargando base SQL...")
+        
+        def with_progress():
+            yield first
+            total = len(first)
+            for chunk in chunks:
+                total += len(chunk)
+                fraction = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+                progress.progress(fraction, text=f"🗄️ {total} filas cargadas")
+                yield chunk
+        
+        with profiler.stage('base_sql_escritura', fuentes=len(sources)) as info:
+            info['rows'] = build_database(dataset_key, with_progress())
+        progress.empty()
+    
+    return get_sql_backend(dataset_key)
+
+
+# -----------------------------------------------------------------------------
+# FILTROS EN CASCADA
+# -----------------------------------------------------------------------------
+# Cubos por zona y conteos por selección que se guardan por dataset
+MAX_ZONE_CUBES = 8
+MAX_FACET_COUNTS = 64
+
+def get_facet_cube(dataset_key, cube, bbox=None):
+    return get_dataset_cache().derived(dataset_key, ('cubo_facetas', bbox), partial(facet_cube, cube),
+                                       limit=MAX_ZONE_CUBES + 1)
+
+def get_zone_cube(dataset_key, bbox, df, sql_backend):
+    # La zona no es una dimensión del cubo: se arma con las filas de la zona
+    def build():
+        with profiler.stage('cubo_zona') as info:
+            if sql_backend is not None:
+                cube = sql_backend.cube({}, bbox=bbox)
+            else:
+                cube_source = [col for col in [DATE_COLUMN] + CUBE_DIMENSIONS if col in df.columns]
+                cube = build_cube(df[cube_source].take(get_spatial_index(dataset_key, df).rows_in_bbox(bbox)))
+            info['rows'] = len(cube)
+            return cube
+    return get_dataset_cache().derived(dataset_key, ('cubo_zona', bbox), build, limit=MAX_ZONE_CUBES)
+
+def get_facet_counts(dataset_key, selection, fecha_inicio, fecha_fin, bbox, cube, df=None, sql_backend=None):
+    # Conteos por opción de cada filtro según los demás (selection: tupla de
+    # (columna, valor)). Con todo el rango de fechas se usa el cubo sin fecha;
+    # con zona, el cubo de las filas dentro de ella
+    def build():
+        with profiler.stage('conteos_filtros', criterios=len(selection)) as info:
+            zone_cube = cube if bbox is None else get_zone_cube(dataset_key, bbox, df, sql_backend)
+            if fecha_inicio is None:
+                source = get_facet_cube(dataset_key, zone_cube, bbox)
+            else:
+                source = slice_cube(zone_cube, {}, fecha_inicio, fecha_fin)
+            info['rows'] = len(source)
+            columns = [col for col in CUBE_DIMENSIONS if col in source.columns]
+            return facet_counts(source, dict(selection), columns)
+    return get_dataset_cache().derived(dataset_key, ('conteos_filtros', selection, fecha_inicio, fecha_fin, bbox),
+                                       build, limit=MAX_FACET_COUNTS)
+
+
+def facet_key(col, dataset_key):
+    return f"filtro_{col}_{dataset_key}"
+
+
+def facet_selectbox(label, col, dataset_key, options, counts):
+    # Sólo los valores con datos bajo los demás filtros y su conteo; el valor
+    # elegido se conserva aunque quede en cero (ej. por el rango de fechas)
+    key = facet_key(col, dataset_key)
+    selected = st.session_state.get(key, 'TODOS')
+    values = ['TODOS'] + [value for value in options if value in counts or value == selected]
+    return st.selectbox(label, values, key=key, format_func=lambda value: f"{value} ({counts.get(value, 0)})")
+
+
+def reset_zone(zone_keys, zone_bounds):
+    for key, bounds in zip(zone_keys, zone_bounds):
+        st.session_state[key] = bounds
+
+# Espacio para los KPIs parciales durante la carga de CSV grandes
+kpi_preview = st.empty()
 
 # -----------------------------------------------------------------------------
 # SIDEBAR: CARGA DE DATOS Y FILTROS
 # -----------------------------------------------------------------------------
 with st.sidebar:
     st.header("📂 Carga de Datos")
-    uploaded_file = st.file_uploader(
-        "Sube tu archivo Excel/CSV",
+    uploaded_files = st.file_uploader(
+        "Sube tus archivos Excel/CSV",
         type=['xlsx', 'xls', 'csv'],
-        help="Sube el archivo 'BDPROGRAMA_2016-2025.xlsx'"
-    )
+        accept_multiple_files=True,
+        help="Sube el archivo 'BDPROGRAMA_2016-2025.xlsx' u otros extractos con las mismas columnas"
+    ) or []
+    
+    # Fuentes a cargar: (archivo, hoja). Hoja None = primera hoja o CSV
+    sources, source_keys = [], []
+    for uploaded_file in uploaded_files:
+        file_key = content_hash(uploaded_file.getvalue())
+        sheets = [None]
+        if not uploaded_file.name.lower().endswith('.csv'):
+            sheet_names = get_sheet_names(file_key, uploaded_file)
+            if len(sheet_names) > 1:
+                todas = st.checkbox(f"Todas las hojas de {uploaded_file.name}", key=f"todas_{file_key}")
+                selected_sheets = sheet_names if todas else st.multiselect(
+                    f"Hojas de {uploaded_file.name}", sheet_names, default=sheet_names[:1], key=f"hojas_{file_key}"
+                )
+                if not selected_sheets:
+                    st.warning(f"No se seleccionaron hojas de {uploaded_file.name}")
+                sheets = [None if sheet == sheet_names[0] else sheet for sheet in selected_sheets]
+        for sheet in sheets:
+            sources.append((uploaded_file, sheet))
+            source_keys.append((file_key, sheet))
+    
+    # Modo histórico: el archivo se fusiona por FOLIO con lo ya cargado en vez
+    # de reemplazarlo (sólo con los datos en memoria)
+    modo_historico = False
+    if not sql_backend_requested():
+        modo_historico = st.toggle(
+            "Agregar al histórico", key='modo_historico',
+            help="Fusiona el archivo con el histórico guardado: sólo se procesan los FOLIO nuevos o modificados"
+        )
     
     st.markdown("---")
     
-    # Cargar datos
-    df = load_data(uploaded_file)
+    # Clave del dataset: hash del contenido subido y de las hojas elegidas
+    dataset_key = sources_key(source_keys) if sources else None
+    
+    # Backend SQL opcional: los datos quedan en disco y se consultan por partes
+    sql_backend = None
+    history_generation = None
+    ingest_pending = False
+    if sql_backend_requested() and sources:
+        with profiler.stage('base_sql', fuentes=len(sources)):
+            sql_backend = open_sql_dataset(sources, dataset_key)
     
-    if df is not None and not df.empty:
+    if sql_backend is not None:
+        df = None
+        columns = sql_backend.columns
+        st.success(f"✅ Datos en base SQL: {get_sql_stats(dataset_key)['total']} filas, {len(columns)} columnas")
+    else:
+        # Contenido nuevo (sin snapshot): se lee en segundo plano con progreso
+        # y botón de cancelar. Los reruns se enganchan al mismo trabajo y la
+        # sesión sigue sin datos hasta que termina
+        ingest_job = None
+        if sources and not snapshot_path(dataset_key).exists() and get_dataset_cache().peek(dataset_key) is None:
+            if st.session_state.get('ingesta_cancelada') == dataset_key:
+                ingest_pending = True
+                st.warning("Carga cancelada: quita el archivo o vuelve a intentarlo")
+                if st.button("🔁 Reintentar carga"):
+                    del st.session_state['ingesta_cancelada']
+                    st.rerun()
+            else:
+                ingest_job = start_ingest_job(sources, dataset_key)
+        
+        if ingest_job is not None and ingest_job.state == JOB_RUNNING:
+            ingest_pending = True
+            with kpi_preview.container():
+                render_ingest_progress(dataset_key)
+        elif ingest_job is not None and ingest_job.state == JOB_FAILED:
+            ingest_pending = True
+            st.error(f"❌ Error al procesar el archivo: {ingest_job.error.splitlines()[0]}")
+            with st.expander("Detalles del error"):
+                st.code(ingest_job.error)
+            if st.button("🔁 Reintentar carga"):
+                get_ingest_jobs().discard(dataset_key)
+                st.rerun()
+        
+        # Sin archivos se sirve el snapshot publicado por precompute.py, si existe
+        published = read_published() if not sources and not modo_historico else None
+        if published is not None and get_published_frame(published['dataset_key']) is None:
+            published = None
+        
+        # Cargar datos (en caché: sólo la primera carga de cada archivo parsea)
+        with profiler.stage('carga_datos') as info:
+            if ingest_pending:
+                df = pd.DataFrame()
+            elif ingest_job is not None and ingest_job.state == JOB_DONE:
+                # Terminado sin snapshot (estructura inesperada): se muestran los
+                # avisos. El resultado pasa a la caché de datasets, que lo cuenta
+                # en el presupuesto, y el trabajo se descarta para no retenerlo
+                df = get_dataset_cache().get(dataset_key, partial(getattr, ingest_job, 'result'), spill=False)
+                if not df.empty:
+                    get_ingest_jobs().discard(dataset_key)
+                st.success(f"✅ Datos cargados: {len(df)} filas, {len(df.columns)} columnas")
+                check_structure(df)
+            elif published is not None:
+                dataset_key = published['dataset_key']
+                df = get_published_frame(dataset_key)
+                st.success(f"📦 Datos precalculados: {published['rows']} filas de "
+                           f"{', '.join(published['sources'])} ({published['created'].replace('T', ' ')})")
+            elif sources:
+                df = load_dataset(dataset_key, sources)
+            elif not modo_historico:
+                show_instructions()
+                df = pd.DataFrame()
+            else:
+                df = pd.DataFrame()
+            info['rows'] = len(df)
+        
+        if modo_historico:
+            manifest = read_manifest()
+            if not df.empty and 'FOLIO' in df.columns:
+                with profiler.stage('fusion_historico', rows=len(df)) as info:
+                    # El histórico en memoria sólo se aprovecha al compactar segmentos
+                    history = get_dataset_cache().peek(history_key(manifest['generation']))
+                    report, manifest = merge_into_history(df, dataset_key, history, manifest['generation'])
+                    info.update(report)
+                st.info(
+                    f"🔁 Fusión con el histórico: {report['insertados']} nuevos · "
+                    f"{report['actualizados']} actualizados · {report['duplicados']} duplicados · "
+                    f"{report['conflictos']} en conflicto"
+                )
+            
+            if manifest['segments']:
+                history_generation = manifest['generation']
+                df = get_history(history_generation)
+                dataset_key = history_key(history_generation)
+                st.caption(f"📚 Histórico: {len(df)} registros de {len(manifest['sources'])} archivos")
+        columns = list(df.columns)
+    
+    data_loaded = sql_backend is not None or (df is not None and not df.empty)
+    folio_query = ''
+    bbox = None
+    
+    if data_loaded:
         st.header("🔍 Filtros")
+        if sql_backend is not None:
+            dataset_stats = get_sql_stats(dataset_key)
+        else:
+            dataset_stats = get_dataset_stats(dataset_key, df)
+        options = dataset_stats['options']
+        
+        # Opciones en cascada: cada filtro muestra los valores con datos bajo
+        # los demás filtros y fechas elegidos, contados sobre el cubo. Las
+        # selecciones se leen del estado porque los widgets aún no se dibujaron
+        if sql_backend is not None:
+            base_cube = get_sql_cube(dataset_key)
+        elif history_generation is not None:
+            base_cube = get_history_cube(history_generation)
+        else:
+            base_cube = get_cube(dataset_key, df)
+        selection = tuple(
+            (col, st.session_state[facet_key(col, dataset_key)]) for col in CUBE_DIMENSIONS
+            if st.session_state.get(facet_key(col, dataset_key), 'TODOS') != 'TODOS'
+        )
+        date_keys = (f"fecha_desde_{dataset_key}", f"fecha_hasta_{dataset_key}")
+        facet_fechas = (None, None)
+        if 'fecha_min' in dataset_stats:
+            facet_fechas = (st.session_state.get(date_keys[0], dataset_stats['fecha_min']),
+                            st.session_state.get(date_keys[1], dataset_stats['fecha_max']))
+            if facet_fechas == (dataset_stats['fecha_min'], dataset_stats['fecha_max']):
+                facet_fechas = (None, None)
+        # La zona también se lee del estado: sus controles van después
+        if dataset_stats.get('extent') is not None:
+            zone_bounds = outer_bounds(*dataset_stats['extent'])
+            zone_keys = (f"zona_lat_{dataset_key}", f"zona_lon_{dataset_key}")
+            zone = tuple(tuple(st.session_state.get(key, bounds)) for key, bounds in zip(zone_keys, zone_bounds))
+            if zone != zone_bounds:
+                bbox = (*zone[0], *zone[1])
+        facets = get_facet_counts(dataset_key, selection, *facet_fechas, bbox, base_cube, df, sql_backend)
         
         # Filtro de Wellboat
-        if 'WELLBOAT' in df.columns:
-            wellboats = ['TODOS'] + sorted(df['WELLBOAT'].dropna().unique().tolist())
-            selected_wellboat = st.selectbox("Wellboat", wellboats)
+        if 'WELLBOAT' in columns:
+            selected_wellboat = facet_selectbox("Wellboat", 'WELLBOAT', dataset_key,
+                                                options['WELLBOAT'], facets['WELLBOAT'])
         else:
             st.warning("No hay columna 'WELLBOAT' en los datos")
             selected_wellboat = 'TODOS'
         
         # Filtro de Resultado
-        if 'RESULTADO' in df.columns:
-            resultados = ['TODOS'] + sorted(df['RESULTADO'].dropna().unique().tolist())
-            selected_resultado = st.selectbox("Resultado", resultados)
+        if 'RESULTADO' in columns:
+            selected_resultado = facet_selectbox("Resultado", 'RESULTADO', dataset_key,
+                                                 options['RESULTADO'], facets['RESULTADO'])
         else:
             st.warning("No hay columna 'RESULTADO' en los datos")
             selected_resultado = 'TODOS'
         
         # Filtro de Tipo de Muestreo
-        if 'TIPO MUESTREO' in df.columns:
-            tipos = ['TODOS'] + sorted(df['TIPO MUESTREO'].dropna().unique().tolist())
-            selected_tipo = st.selectbox("Tipo de Muestreo", tipos)
+        if 'TIPO MUESTREO' in columns:
+            selected_tipo = facet_selectbox("Tipo de Muestreo", 'TIPO MUESTREO', dataset_key,
+                                            options['TIPO MUESTREO'], facets['TIPO MUESTREO'])
         else:
             st.warning("No hay columna 'TIPO MUESTREO' en los datos")
             selected_tipo = 'TODOS'
         
         # Filtro por año
-        if 'AÑO' in df.columns:
-            años = ['TODOS'] + sorted(df['AÑO'].dropna().unique().astype(int).tolist())
-            selected_año = st.selectbox("Año", años)
+        if 'AÑO' in columns:
+            selected_año = facet_selectbox("Año", 'AÑO', dataset_key, options['AÑO'], facets['AÑO'])
         else:
             selected_año = 'TODOS'
         
         # Filtro por rango de fechas
         st.markdown("**📅 Rango de Fechas**")
-        if 'FECHA MUESTREO' in df.columns and df['FECHA MUESTREO'].notna().any():
-            fecha_min = df['FECHA MUESTREO'].min().date()
-            fecha_max = df['FECHA MUESTREO'].max().date()
+        if 'fecha_min' in dataset_stats:
+            fecha_min = dataset_stats['fecha_min']
+            fecha_max = dataset_stats['fecha_max']
             
-            fecha_inicio = st.date_input("Desde", fecha_min)
-            fecha_fin = st.date_input("Hasta", fecha_max)
+            fecha_inicio = st.date_input("Desde", fecha_min, key=date_keys[0])
+            fecha_fin = st.date_input("Hasta", fecha_max, key=date_keys[1])
             
             st.caption(f"Rango disponible: {fecha_min} a {fecha_max}")
         else:
             fecha_inicio = st.date_input("Desde", datetime(2016, 1, 1).date())
             fecha_fin = st.date_input("Hasta", datetime(2025, 12, 31).date())
         
+        # Filtro por zona: rectángulo lat/lon; el mapa también puede fijarlo
+        # con una selección. Las claves llevan el dataset para no arrastrar la
+        # zona de otro archivo
+        if dataset_stats.get('extent') is not None:
+            st.markdown("**🗺️ Zona**")
+            for key, bounds in zip(zone_keys, zone_bounds):
+                st.session_state.setdefault(key, bounds)
+            lat_range = st.slider("Latitud", *zone_bounds[0], step=0.01, key=zone_keys[0])
+            lon_range = st.slider("Longitud", *zone_bounds[1], step=0.01, key=zone_keys[1])
+            if (tuple(lat_range), tuple(lon_range)) != zone_bounds:
+                bbox = (*lat_range, *lon_range)
+                st.button("Toda la zona", on_click=reset_zone, args=(zone_keys, zone_bounds))
+        
         st.markdown("---")
         st.header("📊 Estadísticas")
-        st.metric("Total Registros", len(df))
+        st.metric("Total Registros", dataset_stats['total'])
         
-        if 'WELLBOAT' in df.columns:
-            st.metric("Wellboats Diferentes", df['WELLBOAT'].nunique())
+        if 'WELLBOAT' in columns:
+            st.metric("Wellboats Diferentes", dataset_stats['wellboats'])
         
-        if 'RESULTADO' in df.columns:
-            positivos_total = len(df[df['RESULTADO'] == 'POSITIVO'])
-            st.metric("Positivos Totales", positivos_total)
+        if 'RESULTADO' in columns:
+            st.metric("Positivos Totales", dataset_stats['positivos'])
+        
+        # Búsqueda directa de una muestra, independiente de los filtros
+        if 'FOLIO' in columns:
+            st.markdown("---")
+            st.header("🔎 Buscar FOLIO")
+            folio_query = st.text_input(
+                "FOLIO o prefijo", key='buscar_folio', placeholder="QLL-FAN-2019-",
+                help="Busca un FOLIO exacto o todos los que empiezan con el texto"
+            )
 
 # -----------------------------------------------------------------------------
 # APLICAR FILTROS
 # -----------------------------------------------------------------------------
-if df is not None and not df.empty:
-    df_filtered = df.copy()
-    
+if data_loaded:
     # Contador inicial
-    initial_count = len(df_filtered)
+    initial_count = dataset_stats['total']
     
-    # Aplicar filtros
+    # Aplicar filtros: se combinan las listas de filas del índice y el
+    # DataFrame se materializa una sola vez al final
     filters_applied = []
+    criteria = {}
     
     if selected_wellboat != 'TODOS':
-        df_filtered = df_filtered[df_filtered['WELLBOAT'] == selected_wellboat]
+        criteria['WELLBOAT'] = selected_wellboat
         filters_applied.append(f"Wellboat: {selected_wellboat}")
     
     if selected_resultado != 'TODOS':
-        df_filtered = df_filtered[df_filtered['RESULTADO'] == selected_resultado]
+        criteria['RESULTADO'] = selected_resultado
         filters_applied.append(f"Resultado: {selected_resultado}")
     
     if selected_tipo != 'TODOS':
-        df_filtered = df_filtered[df_filtered['TIPO MUESTREO'] == selected_tipo]
+        criteria['TIPO MUESTREO'] = selected_tipo
         filters_applied.append(f"Tipo: {selected_tipo}")
     
-    if selected_año != 'TODOS' and 'AÑO' in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered['AÑO'] == selected_año]
+    if selected_año != 'TODOS' and 'AÑO' in columns:
+        criteria['AÑO'] = selected_año
         filters_applied.append(f"Año: {selected_año}")
     
     # Filtrar por rango de fechas
-    if 'FECHA MUESTREO' in df_filtered.columns:
+    fecha_inicio_dt = fecha_fin_dt = None
+    if 'FECHA MUESTREO' in columns:
         try:
             fecha_inicio_dt = pd.to_datetime(fecha_inicio)
-            fecha_fin_dt = pd.to_datetime(fecha_fin)
-            
-            df_filtered = df_filtered[
-                (df_filtered['FECHA MUESTREO'] >= fecha_inicio_dt) &
-                (df_filtered['FECHA MUESTREO'] <= fecha_fin_dt)
-            ]
+            # "Hasta" incluye el día completo
+            fecha_fin_dt = pd.to_datetime(fecha_fin) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
             filters_applied.append(f"Fechas: {fecha_inicio} a {fecha_fin}")
         except Exception as e:
             st.warning(f"Error al filtrar por fechas: {e}")
     
+    # Con zona activa quedan fuera las muestras sin coordenadas
+    if bbox is not None:
+        filters_applied.append(f"Zona: lat {bbox[0]:g} a {bbox[1]:g}, lon {bbox[2]:g} a {bbox[3]:g}")
+    
+    # Con el backend SQL sólo se cuenta: las filas se piden por página
+    with profiler.stage('filtros', criterios=len(criteria)) as info:
+        if sql_backend is not None:
+            row_ids = None
+            final_count = sql_backend.count(criteria, fecha_inicio_dt, fecha_fin_dt, bbox=bbox)
+        else:
+            row_ids = get_filter_index(dataset_key, df).select(criteria, fecha_inicio_dt, fecha_fin_dt)
+            if bbox is not None:
+                row_ids = np.intersect1d(row_ids, get_spatial_index(dataset_key, df).rows_in_bbox(bbox),
+                                         assume_unique=True)
+            final_count = len(row_ids)
+        info['rows'] = final_count
+    
     # Mostrar información de filtros aplicados
     if filters_applied:
         st.sidebar.info(f"Filtros aplicados: {len(filters_applied)}")
         for filtro in filters_applied:
             st.sidebar.text(f"• {filtro}")
     
-    final_count = len(df_filtered)
     st.sidebar.metric("Registros filtrados", final_count, delta=final_count-initial_count)
 
 # -----------------------------------------------------------------------------
-# SECCIÓN PRINCIPAL - VISUALIZACIONES
+# FRAGMENTOS DEL DASHBOARD
 # -----------------------------------------------------------------------------
-if df is not None and not df.empty:
-    if len(df_filtered) > 0:
-        # -----------------------------------------------------------------------------
-        # KPIs
-        # -----------------------------------------------------------------------------
-        st.header("📊 Indicadores Clave")
+# Cada sección se vuelve a ejecutar sola cuando cambian sus propios widgets, y
+# sus agregados y figuras se guardan por estado de filtros en una LRU compartida
+RESULT_CACHE_ENTRIES = 256
+
+
+@st.cache_resource
+def get_result_cache():
+    return LRUCache(RESULT_CACHE_ENTRIES)
+
+
+def memoized(filter_key, name, compute, *params):
+    return get_result_cache().get_or_compute((filter_key, name, *params), compute)
+
+
+def figure_or_none(data, build_figure):
+    return None if data.empty else build_figure(data)
+
+
+@st.fragment
+@profiled_fragment
+def render_kpi_section(filter_key, filtered_cube):
+    st.header("📊 Indicadores Clave")
+    
+    def compute_kpis():
+        cube_filtered = filtered_cube()
+        wellboats = positivos = negativos = 0
+        if 'WELLBOAT' in cube_filtered.columns:
+            wellboats = cube_counts(cube_filtered, 'WELLBOAT').size
+        if 'RESULTADO' in cube_filtered.columns:
+            positivos = cube_total(cube_filtered, 'RESULTADO', 'POSITIVO')
+            negativos = cube_total(cube_filtered, 'RESULTADO', 'NEGATIVO')
+        return cube_total(cube_filtered), wellboats, positivos, negativos
+    
+    render_kpis(*memoized(filter_key, 'kpis', compute_kpis))
+
+
+@st.fragment
+@profiled_fragment
+def render_monthly_chart(filter_key, filtered_cube, columns):
+    st.subheader("📈 Resultados por Mes")
+    if 'RESULTADO' in columns and 'FECHA' in columns:
+        with profiler.stage('grafico_resultados_mes'):
+            fig = memoized(filter_key, 'resultados_mes', lambda: figure_or_none(
+                monthly_results(filtered_cube()), fig_monthly_results))
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
         
-        col1, col2, col3, col4 = st.columns(4)
+        if fig is None:
+            st.info("No hay datos de POSITIVO/NEGATIVO para mostrar")
+    else:
+        st.info("Faltan columnas para el gráfico de resultados por mes")
+
+
+@st.fragment
+@profiled_fragment
+def render_wellboat_chart(filter_key, filtered_cube, columns):
+    st.subheader("📊 Top 10 Wellboats")
+    if 'WELLBOAT' in columns:
+        # Contar muestras por wellboat
+        with profiler.stage('grafico_top_wellboats'):
+            wellboat_counts = memoized(filter_key, 'top_wellboats', lambda: top_wellboats(filtered_cube()))
+            if not wellboat_counts.empty:
+                fig = memoized(filter_key, 'fig_top_wellboats', lambda: fig_top_wellboats(wellboat_counts))
+                st.plotly_chart(fig, use_container_width=True)
         
-        with col1:
-            st.metric("Total Muestras", len(df_filtered))
+        if not wellboat_counts.empty:
+            # Mostrar tabla debajo
+            with st.expander("Ver tabla detallada", expanded=False):
+                st.dataframe(wellboat_counts.reset_index().rename(
+                    columns={'WELLBOAT': 'Wellboat', 'Cantidad': 'Muestras'}
+                ))
+        else:
+            st.info("No hay datos de wellboats para mostrar")
+
+
+@st.fragment
+@profiled_fragment
+def render_evolution_chart(filter_key, filtered_cube, columns):
+    st.subheader("📅 Evolución Temporal de Muestras")
+    if 'FECHA' in columns:
+        # Agrupar por fecha
+        df_evo = memoized(filter_key, 'diario', lambda: cube_daily(filtered_cube()))
         
-        with col2:
-            st.metric("Wellboats Únicos", df_filtered['WELLBOAT'].nunique())
+        if len(df_evo) > 1:
+            resolucion = st.radio(
+                "Resolución", ['Automática'] + list(RESOLUTIONS),
+                horizontal=True, key='evo_resolucion'
+            )
+            with profiler.stage('grafico_evolucion'):
+                fig = memoized(filter_key, 'evolucion', lambda: fig_evolution(
+                    *evolution_series(df_evo, resolucion)), resolucion)
+                st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("Se necesitan al menos 2 fechas diferentes para el gráfico de evolución")
+
+
+@st.fragment
+@profiled_fragment
+def render_trend_section(filter_key, filtered_cube, columns, resultado_filtrado):
+    st.subheader("⚠️ Tendencia de Positividad")
+    groups = [col for col in ['WELLBOAT', 'TIPO MUESTREO'] if col in columns]
+    if 'RESULTADO' not in columns or 'FECHA' not in columns or not groups:
+        st.info("Faltan columnas para calcular la tasa de positividad")
+        return
+    if resultado_filtrado:
+        st.info("La tasa de positividad necesita ambos resultados: quita el filtro de Resultado")
+        return
+    
+    ctrl1, ctrl2, ctrl3, ctrl4 = st.columns(4)
+    with ctrl1:
+        group_col = st.selectbox("Agrupar por", groups, key='tendencia_grupo')
+    with ctrl2:
+        window = st.selectbox("Ventana", TREND_WINDOWS, format_func=lambda days: f"{days} días",
+                              key='tendencia_ventana')
+    with ctrl3:
+        threshold = st.number_input("Umbral de alerta (% positivos)", 0.0, 100.0, ALERT_THRESHOLD,
+                                    step=1.0, key='tendencia_umbral')
+    with ctrl4:
+        min_samples = st.number_input("Mínimo de muestras en la ventana", 1, value=MIN_WINDOW_SAMPLES,
+                                      key='tendencia_minimo')
+    
+    # Serie diaria por grupo (del cubo filtrado) y tabla de riesgo al último día con datos
+    with profiler.stage('tendencia_positividad', grupo=group_col) as info:
+        daily = memoized(filter_key, 'positividad_diaria', lambda: daily_positivity(filtered_cube(), group_col),
+                         group_col)
+        windows = [window] + [days for days in TREND_WINDOWS if days != window]
+        risk = memoized(filter_key, 'riesgo', lambda: risk_table(daily, group_col, windows, threshold, min_samples),
+                        group_col, window, threshold, min_samples)
+        info['rows'] = len(daily)
+    if risk.empty:
+        st.info("No hay datos suficientes para calcular tendencias")
+        return
+    
+    n_alerts = int(risk['Alerta'].sum())
+    st.metric(f"En alerta ({window} días)", n_alerts, help=f"Tasa ≥ {threshold:g}% con al menos {min_samples} muestras")
+    st.dataframe(
+        risk.assign(Alerta=risk['Alerta'].map({True: '🔴', False: ''})),
+        use_container_width=True, hide_index=True, height=300,
+        column_config={col: st.column_config.NumberColumn(format='%.1f') for col in risk.columns if 'Tasa' in col}
+    )
+    
+    # Evolución de la tasa móvil de los primeros del ranking
+    top_groups = risk[group_col].head(8).tolist()
+    with profiler.stage('grafico_tendencia'):
+        fig = memoized(filter_key, 'fig_tendencia', lambda: figure_or_none(
+            positivity_trends(daily, group_col, top_groups, window),
+            lambda rolling: fig_positivity_trends(rolling, group_col, window, threshold)),
+            group_col, window, threshold, tuple(top_groups))
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Tasa móvil de {window} días de los {len(top_groups)} primeros del ranking")
+
+
+@st.fragment
+@profiled_fragment
+def render_distribution_chart(filter_key, filtered_cube, columns, column):
+    if column == 'TIPO MUESTREO':
+        st.subheader("📋 Distribución por Tipo de Muestreo")
+        build_figure, stage = fig_tipos, 'grafico_tipos'
+    else:
+        st.subheader("📊 Distribución por Resultado")
+        build_figure, stage = fig_resultados, 'grafico_resultados'
+    
+    if column in columns:
+        with profiler.stage(stage):
+            fig = memoized(filter_key, stage, lambda: figure_or_none(
+                cube_counts(filtered_cube(), column), build_figure))
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+@profiled_fragment
+def render_table_section(dataset_key, df, row_ids, sql_backend=None, selection=None):
+    # selection = filtros como argumentos del backend SQL (criteria, fecha_inicio,
+    # fecha_fin, bbox)
+    st.subheader("📋 Vista de Datos Filtrados")
+    columns = sql_backend.columns if sql_backend is not None else list(df.columns)
+    
+    # Seleccionar columnas para mostrar
+    columnas_disponibles = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'ARMADOR', 
+                          'RESULTADO', 'TIPO MUESTREO', 'DIA', 'MES', 'AÑO']
+    columnas_a_mostrar = [col for col in columnas_disponibles if col in columns]
+    
+    # Añadir columnas adicionales si existen
+    additional_cols = [col for col in columns if col not in columnas_disponibles]
+    columnas_a_mostrar.extend(additional_cols[:5])  # Limitar columnas adicionales
+    
+    if not columnas_a_mostrar:
+        st.warning("No hay columnas para mostrar en la tabla")
+        return
+    
+    # Orden y búsqueda se resuelven sobre ids de fila; sólo la página
+    # visible se materializa y se envía al navegador
+    ctrl1, ctrl2, ctrl3, ctrl4 = st.columns([2, 1, 2, 2])
+    with ctrl1:
+        sort_column = st.selectbox("Ordenar por", columnas_a_mostrar, key='tabla_orden')
+    with ctrl2:
+        st.markdown("&nbsp;")
+        descending = st.checkbox("Descendente", key='tabla_desc')
+    with ctrl3:
+        search_column = st.selectbox("Buscar en", columnas_a_mostrar, key='tabla_buscar_col')
+    with ctrl4:
+        search_text = st.text_input("Texto a buscar", key='tabla_buscar')
+    
+    search = (search_column, search_text)
+    with profiler.stage('tabla_orden_busqueda') as info:
+        if sql_backend is not None:
+            n_table_rows = sql_backend.count(**selection, search=search)
+        else:
+            table_ids = search_rows(df, row_ids, search_column, search_text)
+            table_ids = get_sort_order(dataset_key, df, sort_column).sort(table_ids, ascending=not descending)
+            n_table_rows = len(table_ids)
+        info['rows'] = n_table_rows
+    
+    pag1, pag2 = st.columns([1, 3])
+    with pag1:
+        page_size = st.selectbox("Filas por página", PAGE_SIZES, index=2, key='tabla_tamano')
+    _, _, n_pages = page_bounds(n_table_rows, 1, page_size)
+    
+    # Si el filtro cambió y la página guardada ya no existe, volver a la última
+    if st.session_state.get('tabla_pagina', 1) > n_pages:
+        st.session_state['tabla_pagina'] = n_pages
+    with pag2:
+        page = st.number_input("Página", min_value=1, max_value=n_pages, step=1, key='tabla_pagina')
+    
+    start, end, n_pages = page_bounds(n_table_rows, page, page_size)
+    with profiler.stage('tabla_pagina', rows=end - start):
+        if sql_backend is not None:
+            page_df = sql_backend.page(**selection, sort_column=sort_column, ascending=not descending,
+                                       search=search, offset=start, limit=end - start)
+        else:
+            page_df = df.take(table_ids[start:end])
+        st.dataframe(
+            page_df[columnas_a_mostrar],
+            use_container_width=True,
+            height=400
+        )
+    if n_table_rows:
+        st.caption(f"Mostrando registros {start + 1}-{end} de {n_table_rows} (página {page} de {n_pages})")
+    else:
+        st.caption("Ningún registro coincide con la búsqueda")
+    
+    # Exportación de todas las columnas, generada sólo al hacer clic
+    exp1, exp2 = st.columns([1, 2])
+    with exp1:
+        export_format = st.selectbox("Formato de exportación", list(EXPORT_FORMATS), key='export_formato')
+    extension, mime = EXPORT_FORMATS[export_format]
+    with exp2:
+        st.markdown("&nbsp;")
+        st.download_button(
+            label=f"📥 Descargar datos filtrados ({export_format})",
+            data=(partial(export_query, sql_backend, selection, export_format) if sql_backend is not None
+                  else partial(export_rows, df, row_ids, export_format)),
+            file_name=f"datos_filtrados.{extension}",
+            mime=mime,
+            on_click='ignore'
+        )
+
+def sample_bins(spatial, df, row_ids, step):
+    positive = (df['RESULTADO'].take(row_ids) == 'POSITIVO').to_numpy(dtype=bool, na_value=False)
+    return bin_samples(spatial.lat[row_ids], spatial.lon[row_ids], positive, step)
+
+
+def select_map_zone(points, step, zone_keys, zone_bounds):
+    # Rectángulo que cubre las celdas seleccionadas en el mapa (caja o lazo)
+    lats = [point['lat'] for point in points if 'lat' in point]
+    lons = [point['lon'] for point in points if 'lon' in point]
+    if not lats:
+        return
+    selected = ((min(lats) - step / 2, max(lats) + step / 2), (min(lons) - step / 2, max(lons) + step / 2))
+    for key, (low, high), (bound_low, bound_high) in zip(zone_keys, selected, zone_bounds):
+        st.session_state[key] = (max(bound_low, math.floor(low * 100) / 100),
+                                 min(bound_high, math.ceil(high * 100) / 100))
+    st.session_state['zona_desde_mapa'] = True
+
+
+@st.fragment
+@profiled_fragment
+def render_map(filter_key, compute_bins, view_bbox, zone_keys, zone_bounds):
+    st.subheader("🗺️ Mapa de Muestreos")
+    # Una burbuja por celda con datos: la celda automática es la más fina que
+    # mantiene el mapa bajo MAX_MAP_BINS puntos, y una fija nunca es más fina
+    step_labels = {f"{step:g}°": step for step in GRID_STEPS}
+    celda = st.radio("Celda", ['Automática'] + list(step_labels), horizontal=True, key='mapa_celda')
+    min_step = auto_grid_step(view_bbox)
+    step = max(step_labels.get(celda, min_step), min_step)
+    
+    with profiler.stage('mapa', celda=step) as info:
+        bins = memoized(filter_key, 'mapa_celdas', lambda: compute_bins(step), step)
+        info['rows'] = len(bins)
+        if bins.empty:
+            st.info("No hay muestras con coordenadas para mostrar")
+            return
+        fig = memoized(filter_key, 'mapa', lambda: fig_sampling_map(bins, *map_view(view_bbox)), step)
+        event = st.plotly_chart(fig, use_container_width=True, on_select='rerun',
+                                selection_mode=('box', 'lasso'), key='mapa')
+    st.caption(f"{len(bins)} celdas de {step:g}° · {int(bins['Muestras'].sum())} muestras con coordenadas · "
+               "tamaño = muestras, color = % de positivos")
+    
+    points = event.selection.points if event else []
+    if points:
+        st.button(f"📍 Filtrar por las {len(points)} celdas seleccionadas",
+                  on_click=select_map_zone, args=(points, step, zone_keys, zone_bounds))
+    # La zona vive en el panel lateral: aplicarla requiere una ejecución completa
+    if st.session_state.pop('zona_desde_mapa', False):
+        st.rerun()
+
+# -----------------------------------------------------------------------------
+# RESULTADO DE LA BÚSQUEDA DE FOLIO
+# -----------------------------------------------------------------------------
+if data_loaded and folio_query.strip():
+    with profiler.stage('busqueda_folio', consulta=folio_query) as info:
+        if sql_backend is not None:
+            folio_matches, n_folio_matches = sql_backend.lookup_folio(folio_query)
+        else:
+            folio_ids, n_folio_matches = get_folio_index(dataset_key, df).lookup(folio_query)
+            folio_matches = df.take(folio_ids)
+        info['rows'] = n_folio_matches
+    
+    st.subheader(f"🔎 FOLIO: {folio_query.strip().upper()}")
+    if n_folio_matches == 0:
+        st.info("No hay muestras con ese FOLIO o prefijo")
+    else:
+        st.dataframe(folio_matches, use_container_width=True, hide_index=True)
+        if n_folio_matches > len(folio_matches):
+            st.caption(f"Mostrando {len(folio_matches)} de {n_folio_matches} coincidencias: "
+                       "escribe más caracteres para acotar")
+    st.markdown("---")
+
+# -----------------------------------------------------------------------------
+# SECCIÓN PRINCIPAL - VISUALIZACIONES
+# -----------------------------------------------------------------------------
+if data_loaded:
+    if final_count > 0:
+        # Estado de filtros normalizado: clave de los agregados y figuras memorizados
+        filter_key = (dataset_key, tuple(sorted(criteria.items())), fecha_inicio_dt, fecha_fin_dt, bbox)
         
-        with col3:
-            if 'RESULTADO' in df_filtered.columns:
-                positivos = df_filtered[df_filtered['RESULTADO'] == 'POSITIVO'].shape[0]
-                pct_pos = positivos / len(df_filtered) * 100 if len(df_filtered) else 0
-                st.metric("Resultados Positivos", positivos, f"{pct_pos:.1f}%")
+        # Los KPIs y gráficos se responden sumando celdas del cubo filtrado; el
+        # corte sólo se calcula si alguna sección no está en caché
+        @functools.cache
+        def filtered_cube():
+            with profiler.stage('cubo_filtrado') as info:
+                if sql_backend is not None:
+                    cube_filtered = sql_backend.cube(criteria, fecha_inicio_dt, fecha_fin_dt, bbox=bbox)
+                elif bbox is not None:
+                    # La zona no es una dimensión del cubo: se arma con las filas filtradas
+                    cube_source = [col for col in [DATE_COLUMN] + CUBE_DIMENSIONS if col in df.columns]
+                    cube_filtered = build_cube(df[cube_source].take(row_ids))
+                elif history_generation is not None:
+                    cube_filtered = slice_cube(get_history_cube(history_generation), criteria,
+                                               fecha_inicio_dt, fecha_fin_dt)
+                else:
+                    cube_filtered = slice_cube(get_cube(dataset_key, df), criteria, fecha_inicio_dt, fecha_fin_dt)
+                info['rows'] = len(cube_filtered)
+            return cube_filtered
+        
+        if sql_backend is not None:
+            cube_columns = sql_backend.cube_columns
+        elif history_generation is not None:
+            cube_columns = tuple(get_history_cube(history_generation).columns)
+        else:
+            cube_columns = tuple(get_cube(dataset_key, df).columns)
         
-        with col4:
-            if 'RESULTADO' in df_filtered.columns:
-                negativos = df_filtered[df_filtered['RESULTADO'] == 'NEGATIVO'].shape[0]
-                pct_neg = negativos / len(df_filtered) * 100 if len(df_filtered) else 0
-                st.metric("Resultados Negativos", negativos, f"{pct_neg:.1f}%")
+        # -----------------------------------------------------------------------------
+        # KPIs
+        # -----------------------------------------------------------------------------
+        render_kpi_section(filter_key, filtered_cube)
         
         st.markdown("---")
         
         # -----------------------------------------------------------------------------
         # GRÁFICOS
         # -----------------------------------------------------------------------------
-        if len(df_filtered) > 1:  # Necesitamos al menos 2 filas para gráficos significativos
+        if final_count > 1:  # Necesitamos al menos 2 filas para gráficos significativos
             col1, col2 = st.columns(2)
             
             with col1:
-                st.subheader("📈 Resultados por Mes")
-                if 'RESULTADO' in df_filtered.columns and 'MES_NOMBRE' in df_filtered.columns:
-                    # Crear DataFrame para el gráfico
-                    df_mes = df_filtered.copy()
-                    df_mes = df_mes[df_mes['RESULTADO'].isin(['POSITIVO', 'NEGATIVO'])]
-                    
-                    if not df_mes.empty:
-                        # Agrupar por mes y resultado
-                        df_grouped = df_mes.groupby(['MES_NOMBRE', 'RESULTADO']).size().reset_index(name='Cantidad')
-                        
-                        # Ordenar por fecha
-                        df_grouped['Fecha_Orden'] = pd.to_datetime(df_grouped['MES_NOMBRE'], format='%B %Y')
-                        df_grouped = df_grouped.sort_values('Fecha_Orden')
-                        
-                        fig = px.bar(df_grouped, x='MES_NOMBRE', y='Cantidad', color='RESULTADO',
-                                   barmode='group', 
-                                   color_discrete_map={'POSITIVO': 'red', 'NEGATIVO': 'green'},
-                                   category_orders={"MES_NOMBRE": df_grouped['MES_NOMBRE'].tolist()})
-                        fig.update_layout(
-                            xaxis_title='Mes',
-                            yaxis_title='Cantidad de Muestras',
-                            xaxis_tickangle=-45,
-                            legend_title='Resultado'
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No hay datos de POSITIVO/NEGATIVO para mostrar")
-                else:
-                    st.info("Faltan columnas para el gráfico de resultados por mes")
+                render_monthly_chart(filter_key, filtered_cube, cube_columns)
             
             with col2:
-                st.subheader("📊 Top 10 Wellboats")
-                if 'WELLBOAT' in df_filtered.columns:
-                    # Contar muestras por wellboat
-                    wellboat_counts = df_filtered['WELLBOAT'].value_counts().head(10)
-                    
-                    if not wellboat_counts.empty:
-                        fig = px.bar(
-                            x=wellboat_counts.index,
-                            y=wellboat_counts.values,
-                            labels={'x': 'Wellboat', 'y': 'Cantidad de Muestras'},
-                            color=wellboat_counts.values,
-                            color_continuous_scale='viridis'
-                        )
-                        fig.update_layout(xaxis_tickangle=-45)
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Mostrar tabla debajo
-                        with st.expander("Ver tabla detallada", expanded=False):
-                            st.dataframe(wellboat_counts.reset_index().rename(
-                                columns={'index': 'Wellboat', 'WELLBOAT': 'Muestras'}
-                            ))
-                    else:
-                        st.info("No hay datos de wellboats para mostrar")
+                render_wellboat_chart(filter_key, filtered_cube, cube_columns)
             
             st.markdown("---")
             
             # Gráfico de evolución temporal
-            st.subheader("📅 Evolución Temporal de Muestras")
-            if 'FECHA MUESTREO' in df_filtered.columns:
-                # Crear columna de fecha sin hora
-                df_filtered['FECHA'] = df_filtered['FECHA MUESTREO'].dt.date
-                
-                # Agrupar por fecha
-                df_evo = df_filtered.groupby('FECHA').size().reset_index(name='Cantidad')
-                df_evo = df_evo.sort_values('FECHA')
-                
-                if len(df_evo) > 1:
-                    fig = px.line(df_evo, x='FECHA', y='Cantidad',
-                                title='Número de Muestras por Día',
-                                markers=True)
-                    fig.update_layout(
-                        xaxis_title='Fecha',
-                        yaxis_title='Cantidad de Muestras',
-                        hovermode='x unified'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.info("Se necesitan al menos 2 fechas diferentes para el gráfico de evolución")
+            render_evolution_chart(filter_key, filtered_cube, cube_columns)
             
             st.markdown("---")
             
+            # Positividad móvil y grupos en alerta
+            render_trend_section(filter_key, filtered_cube, cube_columns, 'RESULTADO' in criteria)
+            
+            st.markdown("---")
+            
+            # Mapa de muestreos agregado por celdas
+            if dataset_stats.get('extent') is not None:
+                if sql_backend is not None:
+                    compute_bins = partial(sql_backend.map_bins, criteria, fecha_inicio_dt, fecha_fin_dt, bbox)
+                else:
+                    compute_bins = partial(sample_bins, get_spatial_index(dataset_key, df), df, row_ids)
+                render_map(filter_key, compute_bins, bbox or dataset_stats['extent'], zone_keys, zone_bounds)
+                
+                st.markdown("---")
+            
             # Distribución por tipo de muestreo y resultado
             col3, col4 = st.columns(2)
             
             with col3:
-                st.subheader("📋 Distribución por Tipo de Muestreo")
-                if 'TIPO MUESTREO' in df_filtered.columns:
-                    tipo_counts = df_filtered['TIPO MUESTREO'].value_counts()
-                    
-                    if not tipo_counts.empty:
-                        fig = px.pie(
-                            values=tipo_counts.values,
-                            names=tipo_counts.index,
-                            title='Tipos de Muestreo',
-                            hole=0.3
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                render_distribution_chart(filter_key, filtered_cube, cube_columns, 'TIPO MUESTREO')
             
             with col4:
-                st.subheader("📊 Distribución por Resultado")
-                if 'RESULTADO' in df_filtered.columns:
-                    resultado_counts = df_filtered['RESULTADO'].value_counts()
-                    
-                    if not resultado_counts.empty:
-                        fig = px.pie(
-                            values=resultado_counts.values,
-                            names=resultado_counts.index,
-                            title='Distribución de Resultados',
-                            hole=0.3,
-                            color=resultado_counts.index,
-                            color_discrete_map={'POSITIVO': 'red', 'NEGATIVO': 'green'}
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                render_distribution_chart(filter_key, filtered_cube, cube_columns, 'RESULTADO')
             
             st.markdown("---")
             
             # -----------------------------------------------------------------------------
             # TABLA DE DATOS
             # -----------------------------------------------------------------------------
-            st.subheader("📋 Vista de Datos Filtrados")
-            
-            # Seleccionar columnas para mostrar
-            columnas_disponibles = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'ARMADOR', 
-                                  'RESULTADO', 'TIPO MUESTREO', 'DIA', 'MES', 'AÑO']
-            columnas_a_mostrar = [col for col in columnas_disponibles if col in df_filtered.columns]
-            
-            # Añadir columnas adicionales si existen
-            additional_cols = [col for col in df_filtered.columns if col not in columnas_disponibles]
-            columnas_a_mostrar.extend(additional_cols[:5])  # Limitar columnas adicionales
-            
-            if columnas_a_mostrar:
-                # Mostrar tabla con opciones
-                show_all = st.checkbox("Mostrar todos los datos", value=False)
-                
-                if show_all:
-                    st.dataframe(
-                        df_filtered[columnas_a_mostrar],
-                        use_container_width=True,
-                        height=500
-                    )
-                    st.caption(f"Mostrando {len(df_filtered)} registros")
-                else:
-                    # Mostrar solo las primeras filas
-                    st.dataframe(
-                        df_filtered[columnas_a_mostrar].head(100),
-                        use_container_width=True,
-                        height=400
-                    )
-                    st.caption(f"Mostrando 100 de {len(df_filtered)} registros. Marca 'Mostrar todos los datos' para ver todos.")
-                
-                # Opción para descargar datos filtrados
-                csv = df_filtered[columnas_a_mostrar].to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="📥 Descargar datos filtrados (CSV)",
-                    data=csv,
-                    file_name="datos_filtrados.csv",
-                    mime="text/csv"
-                )
-            else:
-                st.warning("No hay columnas para mostrar en la tabla")
+            render_table_section(dataset_key, df, row_ids, sql_backend,
+                                 dict(criteria=criteria, fecha_inicio=fecha_inicio_dt,
+                                      fecha_fin=fecha_fin_dt, bbox=bbox))
         
         else:
             st.warning("⚠️ No hay suficientes datos filtrados para generar visualizaciones")
@@ -548,7 +1260,7 @@ with st.sidebar:
         """)
 
 # Mensaje final si no hay datos
-if df is None or (hasattr(df, 'empty') and df.empty):
+if not data_loaded and not ingest_pending:
     st.error("""
     ## ⚠️ No se pudieron cargar datos
     
@@ -584,3 +1296,38 @@ if df is None or (hasattr(df, 'empty') and df.empty):
         }
         example_df = pd.DataFrame(example_data)
         st.dataframe(example_df)
+
+# -----------------------------------------------------------------------------
+# DIAGNÓSTICO DE RENDIMIENTO (solo con perfilado activo)
+# -----------------------------------------------------------------------------
+if profiler.enabled:
+    profiler.finish()
+    with st.expander("🩺 Diagnóstico de rendimiento", expanded=False):
+        records = pd.DataFrame(profiler.records)
+        records['details'] = records['details'].map(lambda d: json.dumps(d, ensure_ascii=False, default=str))
+        st.dataframe(records[['stage', 'seconds', 'peak_mb', 'rows', 'details']], use_container_width=True)
+        st.caption(f"Ejecución {profiler.run_id} · registros agregados a {PROFILE_LOG} · "
+                   f"picos aproximados si hay otras sesiones perfilando a la vez")
+        
+        cache_stats = get_result_cache().stats()
+        st.caption(f"Caché de gráficos: {cache_stats['entries']}/{cache_stats['max_entries']} entradas · "
+                   f"{cache_stats['hits']} aciertos · {cache_stats['misses']} fallos · "
+                   f"{cache_stats['evictions']} desalojos")
+        dataset_cache_stats = get_dataset_cache().stats()
+        st.caption(f"Caché de datasets: {dataset_cache_stats['entries']} entradas "
+                   f"({dataset_cache_stats['derived']} derivados) · "
+                   f"{dataset_cache_stats['memory_mb']}/{dataset_cache_stats['budget_mb']:.0f} MB · "
+                   f"{dataset_cache_stats['hits']} aciertos · {dataset_cache_stats['misses']} fallos · "
+                   f"{dataset_cache_stats['evictions']} desalojos · {dataset_cache_stats['expirations']} expirados · "
+                   f"{dataset_cache_stats['spills']} volcados a disco · "
+                   f"{dataset_cache_stats['spill_errors']} volcados fallidos")
+        
+        if df is not None and not df.empty:
+            st.markdown("**Tipos de datos**")
+            st.dataframe(pd.DataFrame({
+                'tipo': df.dtypes.astype(str),
+                'memoria_mb': (df.memory_usage(deep=True, index=False) / 1024 ** 2).round(3)
+            }))
+        elif sql_backend is not None:
+            st.caption(f"Base SQL: {sql_backend.path} ({sql_backend.path.stat().st_size / 1024 ** 2:.1f} MB)")
+    profiler.write_log()
@@ -0,0 +1,273 @@
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from charts import (evolution_series, fig_evolution, fig_monthly_results, fig_resultados, fig_tipos,
+                    fig_top_wellboats, monthly_results, top_wellboats)
+from cube import build_cube, cube_counts, cube_daily, slice_cube
+from export import EXPORT_FORMATS, export_chunks, export_rows, iter_row_chunks
+from filter_index import FilterIndex
+from ingest import compact_frame, frame_memory_mb, normalize_frame
+from parallel_ingest import load_sources
+from snapshot_cache import arrow_safe
+from synthetic_data import generate_samples, write_samples
+from table_view import SortOrder, search_rows
+
+# -----------------------------------------------------------------------------
+# BENCHMARK DEL PIPELINE DEL DASHBOARD
+# -----------------------------------------------------------------------------
+# Uso:
+#   python benchmark.py --sizes 10000 100000 --formats csv xlsx --output reporte.json
+#   python benchmark.py --baseline reporte_anterior.json
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+DEFAULT_SIZES = ['10k', '100k']
+FORMATS = ['csv', 'xlsx']
+
+# Excel no admite más filas por hoja
+XLSX_MAX_ROWS = 1_048_575
+
+# Repeticiones de las consultas interactivas (se reporta la mediana)
+QUERY_REPEATS = 5
+PAGE_SIZE = 100
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    yield
+    timings[stage] = round(time.perf_counter() - start, 6)
+
+
+def median_time(func, repeats=QUERY_REPEATS):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples), 6)
+
+
+def read_source(path):
+    # La misma ruta que la app: CSV por bloques, Excel con proyección de
+    # columnas; devuelve el DataFrame ya normalizado y compacto
+    return load_sources([(path.name, path.read_bytes(), None)])
+
+
+def read_raw(path):
+    # Lectura directa con pandas, sin normalizar: base para medir por separado
+    # la normalización y la compactación
+    if path.suffix == '.csv':
+        return pd.read_csv(path)
+    return pd.read_excel(path, engine='openpyxl')
+
+
+def arrow_payload_bytes(df):
+    # Streamlit serializa las tablas como Arrow IPC
+    table = pa.Table.from_pandas(arrow_safe(df), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def filter_scenarios(df):
+    top_wellboat = df['WELLBOAT'].value_counts().index[0]
+    last_year = int(df['AÑO'].max())
+    fecha_max = df['FECHA MUESTREO'].max()
+    return {
+        'sin_filtros': ({}, None, None),
+        'wellboat': ({'WELLBOAT': top_wellboat}, None, None),
+        'ultimo_año': ({}, fecha_max - pd.DateOffset(years=1), fecha_max),
+        'combinado': ({'WELLBOAT': top_wellboat, 'RESULTADO': 'POSITIVO', 'AÑO': last_year}, None, None),
+    }
+
+
+def run_case(path, n_rows):
+    timings, payload_bytes, memory_mb = {}, {}, {}
+
+    # Ingesta de punta a punta (lectura, normalización y compactación)
+    with timed(timings, 'ingest'):
+        df = read_source(path)
+    memory_mb['compact'] = round(frame_memory_mb(df), 2)
+
+    # Normalización y compactación por separado, sobre una lectura cruda
+    raw = read_raw(path)
+    with timed(timings, 'normalize'):
+        normalized = normalize_frame(raw)
+    memory_mb['normalized'] = round(frame_memory_mb(normalized), 2)
+    with timed(timings, 'compact'):
+        compact_frame(normalized)
+    del raw, normalized
+
+    # Filtros
+    with timed(timings, 'filter_index_build'):
+        filter_index = FilterIndex(df)
+    for name, (criteria, fecha_inicio, fecha_fin) in filter_scenarios(df).items():
+        timings[f'filter_{name}'] = median_time(
+            lambda: filter_index.select(criteria, fecha_inicio, fecha_fin))
+
+    # Cubo y gráficos
+    with timed(timings, 'cube_build'):
+        cube = build_cube(df)
+    payload_bytes['cube_cells'] = len(cube)
+    timings['cube_slice'] = median_time(lambda: slice_cube(cube, {}, None, None))
+    cube_filtered = slice_cube(cube, {}, None, None)
+
+    charts = {
+        'resultados_por_mes': (lambda: monthly_results(cube_filtered), fig_monthly_results),
+        'top_wellboats': (lambda: top_wellboats(cube_filtered), fig_top_wellboats),
+        'evolucion': (lambda: evolution_series(cube_daily(cube_filtered)),
+                      lambda result: fig_evolution(*result)),
+        'tipos_muestreo': (lambda: cube_counts(cube_filtered, 'TIPO MUESTREO'), fig_tipos),
+        'resultados': (lambda: cube_counts(cube_filtered, 'RESULTADO'), fig_resultados),
+    }
+    for name, (aggregate, build_figure) in charts.items():
+        timings[f'chart_{name}_aggregate'] = median_time(aggregate)
+        data = aggregate()
+        timings[f'chart_{name}_figure'] = median_time(lambda: build_figure(data))
+        payload_bytes[f'chart_{name}'] = len(build_figure(data).to_json())
+
+    # Tabla paginada y exportación
+    row_ids = filter_index.select({}, None, None)
+    with timed(timings, 'table_sort_order_build'):
+        sort_order = SortOrder(df['FECHA MUESTREO'])
+    timings['table_sort'] = median_time(lambda: sort_order.sort(row_ids, ascending=False))
+    timings['table_search'] = median_time(lambda: search_rows(df, row_ids, 'WELLBOAT', 'orca'))
+    page = df.take(sort_order.sort(row_ids)[:PAGE_SIZE])
+    payload_bytes['table_page'] = arrow_payload_bytes(page)
+
+    # st.download_button sólo acepta bytes o lectores de archivo: si la
+    # exportación devolviera otro tipo, el benchmark falla aquí
+    for export_format, (extension, _) in EXPORT_FORMATS.items():
+        stage = f"export_{extension.replace('.', '_')}"
+        with timed(timings, stage):
+            exported = export_rows(df, row_ids, export_format)
+            if not isinstance(exported, (bytes, io.RawIOBase, io.BufferedReader)):
+                raise TypeError(f"Exportación {export_format}: tipo no soportado por st.download_button "
+                                f"({type(exported).__name__})")
+            if isinstance(exported, bytes):
+                data = exported
+            else:
+                with exported:
+                    data = exported.read()
+        payload_bytes[stage] = len(data)
+
+    return {
+        'rows': n_rows,
+        'format': path.suffix.lstrip('.'),
+        'file_bytes': path.stat().st_size,
+        'timings_s': timings,
+        'payload_bytes': payload_bytes,
+        'memory_mb': memory_mb,
+    }
+
+
+def check_sparse_text_export(chunk_rows=2):
+    # Columna de texto (object, como en pandas 2) vacía en el primer bloque y
+    # con valores después, como MUESTREADOR o ANALISTA en un CSV: cada formato
+    # debe exportarla completa aunque el esquema salga de un DataFrame vacío
+    df = pd.DataFrame({
+        'FOLIO': ['F1', 'F2', 'F3', 'F4'],
+        'MUESTREADOR': pd.Series([None, None, 'ANA', 'LUIS'], dtype=object),
+    })
+    readers = {
+        'CSV (gzip)': lambda data: pd.read_csv(data, compression='gzip'),
+        'Parquet': pd.read_parquet,
+        'Excel (XLSX)': pd.read_excel,
+    }
+    row_ids = np.arange(len(df))
+    for export_format in EXPORT_FORMATS:
+        with export_chunks(iter_row_chunks(df, row_ids, chunk_rows), df.head(0), export_format) as data:
+            exported = readers[export_format](data)
+        if exported['MUESTREADOR'].tolist()[2:] != ['ANA', 'LUIS']:
+            raise ValueError(f"Exportación {export_format}: se perdió el texto de MUESTREADOR")
+
+
+def compare(report, baseline, tolerance):
+    # Compara tiempos por etapa con un reporte anterior; True si hay regresión
+    previous = {(r['rows'], r['format']): r for r in baseline['results']}
+    regression = False
+    for result in report['results']:
+        before = previous.get((result['rows'], result['format']))
+        if before is None:
+            continue
+        for stage, seconds in result['timings_s'].items():
+            old = before['timings_s'].get(stage)
+            if not old or old < 0.001:
+                continue
+            ratio = seconds / old
+            if ratio > tolerance:
+                regression = True
+                print(f"⚠️ {result['format']} {result['rows']}: {stage} {old:.4f}s -> {seconds:.4f}s (x{ratio:.2f})")
+    return regression
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline del dashboard de muestreo")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, choices=list(SIZES))
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--data-dir', type=Path, help="Directorio donde dejar los archivos generados")
+    parser.add_argument('--output', type=Path, default=Path('benchmark_report.json'))
+    parser.add_argument('--baseline', type=Path, help="Reporte anterior para detectar regresiones")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="Factor de lentitud tolerado respecto al baseline")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'platform': platform.platform(),
+        'results': [],
+        'skipped': [],
+    }
+
+    check_sparse_text_export()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or Path(tmp_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        for size in args.sizes:
+            n_rows = SIZES[size]
+            samples = generate_samples(n_rows, seed=args.seed)
+            for file_format in args.formats:
+                if file_format == 'xlsx' and n_rows > XLSX_MAX_ROWS:
+                    report['skipped'].append({'rows': n_rows, 'format': file_format,
+                                              'reason': 'supera el límite de filas de Excel'})
+                    continue
+                path = data_dir / f"muestreo_{size}.{file_format}"
+                if not path.exists():
+                    write_samples(samples, path)
+                print(f"▶ {file_format} {size}...", flush=True)
+                result = run_case(path, n_rows)
+                report['results'].append(result)
+                print(f"  ingesta {result['timings_s']['ingest']:.2f}s, "
+                      f"memoria {result['memory_mb']['normalized']} -> {result['memory_mb']['compact']} MB",
+                      flush=True)
+
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Reporte guardado en {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
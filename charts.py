@@ -0,0 +1,130 @@
+import plotly.express as px
+
+from cube import cube_counts, cube_monthly, month_labels
+from trends import rolling_positivity
+from timeseries import WEBGL_MIN_POINTS, auto_resolution, downsample, resample_counts
+
+# -----------------------------------------------------------------------------
+# AGREGACIONES Y FIGURAS DEL DASHBOARD
+# -----------------------------------------------------------------------------
+# Cada gráfico se separa en su agregación (sobre el cubo filtrado) y la
+# construcción de la figura, para poder medirlas y reutilizarlas por separado
+RESULT_COLORS = {'POSITIVO': 'red', 'NEGATIVO': 'green'}
+
+
+def monthly_results(cube):
+    cube_mes = cube[cube['RESULTADO'].isin(['POSITIVO', 'NEGATIVO'])]
+    if cube_mes.empty:
+        return cube_mes
+
+    # Agrupar por mes y resultado (ya en orden cronológico)
+    df_grouped = cube_monthly(cube_mes, 'RESULTADO')
+    df_grouped['MES_NOMBRE'] = df_grouped['MES'].map(month_labels(df_grouped['MES']))
+    return df_grouped
+
+
+def fig_monthly_results(df_grouped):
+    fig = px.bar(df_grouped, x='MES_NOMBRE', y='Cantidad', color='RESULTADO',
+               barmode='group',
+               color_discrete_map=RESULT_COLORS,
+               category_orders={"MES_NOMBRE": df_grouped['MES_NOMBRE'].unique().tolist()})
+    fig.update_layout(
+        xaxis_title='Mes',
+        yaxis_title='Cantidad de Muestras',
+        xaxis_tickangle=-45,
+        legend_title='Resultado'
+    )
+    return fig
+
+
+def top_wellboats(cube, n=10):
+    return cube_counts(cube, 'WELLBOAT').head(n)
+
+
+def fig_top_wellboats(wellboat_counts):
+    fig = px.bar(
+        x=wellboat_counts.index.astype(str),
+        y=wellboat_counts.values,
+        labels={'x': 'Wellboat', 'y': 'Cantidad de Muestras'},
+        color=wellboat_counts.values,
+        color_continuous_scale='viridis'
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def evolution_series(df_evo, resolution='Automática'):
+    # Resolución según el rango mostrado, o la elegida por el usuario
+    if resolution == 'Automática':
+        resolution = auto_resolution(df_evo['FECHA'].min(), df_evo['FECHA'].max())
+
+    # Payload acotado: rangos muy largos se reducen con LTTB
+    return downsample(resample_counts(df_evo, resolution)), resolution
+
+
+def fig_evolution(df_evo, resolution):
+    fig = px.line(df_evo, x='FECHA', y='Cantidad',
+                title=f'Número de Muestras por {resolution}',
+                markers=len(df_evo) <= 200,
+                render_mode='webgl' if len(df_evo) >= WEBGL_MIN_POINTS else 'auto')
+    fig.update_layout(
+        xaxis_title='Fecha',
+        yaxis_title='Cantidad de Muestras',
+        hovermode='x unified'
+    )
+    return fig
+
+
+def positivity_trends(daily, group_col, groups, window_days):
+    # Tasa móvil de todos los grupos en una pasada; se grafican sólo los pedidos
+    rolling = rolling_positivity(daily, group_col, window_days)
+    rolling = rolling[rolling[group_col].isin(groups)]
+    rolling[group_col] = rolling[group_col].astype(str)
+    return rolling
+
+
+def fig_positivity_trends(rolling, group_col, window_days, threshold):
+    fig = px.line(rolling, x='FECHA', y='Tasa', color=group_col,
+                  hover_data={'Muestras': True, 'Positivos': True, 'Tasa': ':.1f'},
+                  render_mode='webgl' if len(rolling) >= WEBGL_MIN_POINTS else 'auto')
+    fig.add_hline(y=threshold, line_dash='dash', line_color=RESULT_COLORS['POSITIVO'],
+                  annotation_text=f'Umbral {threshold:g}%')
+    fig.update_layout(
+        xaxis_title='Fecha',
+        yaxis_title=f'% Positivos ({window_days} días)',
+        legend_title=group_col.title()
+    )
+    return fig
+
+
+def fig_tipos(tipo_counts):
+    return px.pie(
+        values=tipo_counts.values,
+        names=tipo_counts.index.astype(str),
+        title='Tipos de Muestreo',
+        hole=0.3
+    )
+
+
+def fig_resultados(resultado_counts):
+    return px.pie(
+        values=resultado_counts.values,
+        names=resultado_counts.index.astype(str),
+        title='Distribución de Resultados',
+        hole=0.3,
+        color=resultado_counts.index.astype(str),
+        color_discrete_map=RESULT_COLORS
+    )
+
+
+def fig_sampling_map(bins, center, zoom):
+    # Un marcador por celda: tamaño = muestras, color = % de positivos
+    fig = px.scatter_map(
+        bins, lat='LAT', lon='LON', size='Muestras', color='Tasa',
+        color_continuous_scale=[RESULT_COLORS['NEGATIVO'], 'gold', RESULT_COLORS['POSITIVO']],
+        range_color=(0, max(float(bins['Tasa'].max()), 1.0)),
+        hover_data={'Muestras': True, 'Positivos': True, 'Tasa': ':.1f', 'LAT': ':.2f', 'LON': ':.2f'},
+        size_max=28, zoom=zoom, center=center, map_style='carto-positron', height=550
+    )
+    fig.update_layout(coloraxis_colorbar_title='% Positivos', margin=dict(l=0, r=0, t=0, b=0))
+    return fig
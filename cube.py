@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# CUBO DE CONTEOS PRE-AGREGADO
+# -----------------------------------------------------------------------------
+# Una celda por combinación observada de día × dimensiones; todos los KPIs y
+# gráficos se responden sumando celdas, sin volver a recorrer las muestras
+CUBE_DIMENSIONS = ['WELLBOAT', 'RESULTADO', 'TIPO MUESTREO', 'AÑO']
+DATE_COLUMN = 'FECHA MUESTREO'
+
+
+def build_cube(df):
+    dims = [col for col in CUBE_DIMENSIONS if col in df.columns]
+    keys = [df[col] for col in dims]
+    if DATE_COLUMN in df.columns:
+        keys.insert(0, df[DATE_COLUMN].dt.normalize().rename('FECHA'))
+    if not keys:
+        return pd.DataFrame({'Cantidad': [len(df)]})
+
+    cube = df.groupby(keys, observed=True, dropna=False).size().reset_index(name='Cantidad')
+    if 'FECHA' in cube.columns:
+        # Los filtros de fecha nunca incluyen filas sin fecha válida
+        cube = cube[cube['FECHA'].notna()].sort_values('FECHA', kind='stable').reset_index(drop=True)
+        # Clave de mes (Period) para agrupar y ordenar sin pasar por texto
+        cube['MES'] = cube['FECHA'].dt.to_period('M')
+    cube['Cantidad'] = cube['Cantidad'].astype(np.int64)
+    return cube
+
+
+def slice_cube(cube, criteria, fecha_inicio=None, fecha_fin=None):
+    # Rango de fechas por búsqueda binaria (el cubo está ordenado por día)
+    if 'FECHA' in cube.columns and (fecha_inicio is not None or fecha_fin is not None):
+        fechas = cube['FECHA'].to_numpy()
+        lo = 0 if fecha_inicio is None else np.searchsorted(
+            fechas, pd.Timestamp(fecha_inicio).normalize().to_datetime64().astype(fechas.dtype), side='left')
+        hi = len(cube) if fecha_fin is None else np.searchsorted(
+            fechas, pd.Timestamp(fecha_fin).normalize().to_datetime64().astype(fechas.dtype), side='right')
+        cube = cube.iloc[lo:max(lo, hi)]
+
+    mask = np.ones(len(cube), dtype=bool)
+    for col, value in criteria.items():
+        mask &= (cube[col] == value).to_numpy()
+    return cube[mask]
+
+
+def cube_total(cube, col=None, value=None):
+    if col is None:
+        return int(cube['Cantidad'].sum())
+    return int(cube.loc[cube[col] == value, 'Cantidad'].sum())
+
+
+def cube_counts(cube, col):
+    # Conteo por valor, de mayor a menor y sin categorías vacías
+    counts = cube.groupby(col, observed=True)['Cantidad'].sum()
+    return counts[counts > 0].sort_values(ascending=False)
+
+
+def cube_daily(cube):
+    return cube.groupby('FECHA')['Cantidad'].sum().reset_index()
+
+
+def month_labels(months):
+    # Etiquetas de texto sólo para los meses únicos que se van a graficar
+    unique_months = pd.PeriodIndex(pd.unique(months))
+    return dict(zip(unique_months, unique_months.strftime('%B %Y')))
+
+
+def cube_monthly(cube, col):
+    # Conteo por mes (clave Period) y valor de col, en orden cronológico
+    grouped = cube.groupby(['MES', col], observed=True)['Cantidad'].sum()
+    return grouped[grouped > 0].reset_index().sort_values('MES', kind='stable')
+
+
+def facet_cube(cube):
+    # Sin la fecha: una celda por combinación de dimensiones observada. Sus
+    # filas crecen con las categorías, no con las muestras ni los días
+    dims = [col for col in CUBE_DIMENSIONS if col in cube.columns]
+    if not dims:
+        return pd.DataFrame({'Cantidad': [int(cube['Cantidad'].sum())]})
+    facets = cube.groupby(dims, observed=True, dropna=False)['Cantidad'].sum().reset_index()
+    return facets[facets['Cantidad'] > 0].reset_index(drop=True)
+
+
+def facet_counts(cube, criteria, columns):
+    # Conteo por valor de cada columna con los demás criterios aplicados (no el
+    # propio, para ver a qué otro valor se puede cambiar)
+    counts = {}
+    for col in columns:
+        others = {key: value for key, value in criteria.items() if key != col}
+        sliced = slice_cube(cube, others)
+        grouped = sliced.groupby(col, observed=True)['Cantidad'].sum()
+        counts[col] = {'TODOS': int(sliced['Cantidad'].sum()), **grouped[grouped > 0].to_dict()}
+    return counts
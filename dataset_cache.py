@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingest import frame_memory_mb
+from snapshot_cache import snapshot_path, write_snapshot
+
+# -----------------------------------------------------------------------------
+# CACHÉ DE DATASETS CON PRESUPUESTO DE MEMORIA
+# -----------------------------------------------------------------------------
+# Un DataFrame por clave de contenido, compartido por todas las sesiones. Se
+# desalojan los menos usados cuando la suma supera el presupuesto y los que
+# llevan más de TTL sin usarse; lo desalojado queda (o ya estaba) como
+# snapshot Arrow en disco, así volver a pedirlo es una lectura mapeada y no
+# un nuevo parseo. Lo derivado de un dataset (índices, cubos, estadísticas,
+# conteos de filtros) vive en su misma entrada: cuenta en el presupuesto y se
+# libera con él. Un dataset sin DataFrame en memoria (backend SQL) tiene una
+# entrada sólo con sus derivados
+CACHE_BUDGET_MB = float(os.environ.get('MUESTREO_CACHE_MB', 1024))
+CACHE_TTL_SECONDS = float(os.environ.get('MUESTREO_CACHE_TTL', 6 * 3600))
+
+
+def structure_memory_mb(obj):
+    # Tamaño aproximado de un derivado: las tablas, arreglos y series que guarda
+    def nbytes(value):
+        if isinstance(value, pd.DataFrame):
+            return value.memory_usage(deep=True, index=False).sum()
+        if isinstance(value, (pd.Series, pd.Index)):
+            return value.memory_usage(deep=True)
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum(nbytes(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(nbytes(item) for item in value)
+        if hasattr(value, '__dict__') and not isinstance(value, type):
+            return nbytes(vars(value))
+        return 0
+    return float(nbytes(obj)) / 1024 ** 2
+
+
+def _kind(name):
+    # Los derivados con parámetros se nombran (tipo, *parámetros)
+    return name[0] if isinstance(name, tuple) else name
+
+
+class DatasetCache:
+    # Como LRUCache, la carga de un dataset faltante se hace fuera del lock
+
+    def __init__(self, budget_mb=CACHE_BUDGET_MB, ttl_seconds=CACHE_TTL_SECONDS):
+        self.budget_mb = budget_mb
+        self.ttl_seconds = ttl_seconds
+        # clave -> (DataFrame o None, MB, último uso, guardar en disco al
+        #          desalojar, {nombre: (derivado, MB)})
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.spills = self.spill_errors = 0
+
+    def get(self, key, load, spill=True):
+        # load() devuelve el DataFrame sin efectos en la interfaz; spill=False
+        # para datos que ya tienen su propia copia en disco (ej. el histórico)
+        now = time.time()
+        with self._lock:
+            evicted = self._expire(now)
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None:
+                self._data[key] = (*entry[:2], now, *entry[3:])
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._spill(evicted)
+        if entry is not None and entry[0] is not None:
+            return entry[0]
+
+        df = load()
+        if df is None or df.empty:
+            return df
+        size_mb = frame_memory_mb(df)
+        with self._lock:
+            # Los derivados ya calculados (mismo contenido) se conservan
+            entry = self._data.get(key)
+            self._data[key] = (df, size_mb, time.time(), spill, {} if entry is None else entry[4])
+            self._data.move_to_end(key)
+            evicted = self._evict(keep=key)
+        self._spill(evicted)
+        return df
+
+    def peek(self, key):
+        # El DataFrame si ya está en memoria, sin cargarlo ni contar aciertos
+        with self._lock:
+            entry = self._data.get(key)
+        return None if entry is None else entry[0]
+
+    def derived(self, key, name, build, limit=None):
+        # Derivado del dataset key, construido una vez. limit acota cuántos del
+        # mismo tipo se guardan por dataset (ej. conteos por selección): se
+        # descartan los de uso más antiguo
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and name in entry[4]:
+                # Usar un derivado cuenta como uso del dataset (el backend SQL
+                # sólo pasa por aquí)
+                self._data[key] = (*entry[:2], time.time(), *entry[3:])
+                self._data.move_to_end(key)
+                entry[4][name] = entry[4].pop(name)
+                return entry[4][name][0]
+        structure = build()
+        size_mb = structure_memory_mb(structure)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = (None, 0.0, time.time(), False, {})
+            derived = entry[4]
+            derived[name] = (structure, size_mb)
+            if limit is not None:
+                same_kind = [other for other in derived if _kind(other) == _kind(name)]
+                for other in same_kind[:-limit]:
+                    del derived[other]
+            evicted = self._evict(keep=key)
+        self._spill(evicted)
+        return structure
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._data.items() if now - entry[2] > self.ttl_seconds]
+        evicted = [(key, self._data.pop(key)) for key in expired]
+        self.expirations += len(evicted)
+        return evicted
+
+    def _evict(self, keep):
+        # El dataset recién cargado se queda aunque solo supere el presupuesto
+        evicted = []
+        while self._memory_mb() > self.budget_mb and len(self._data) > 1:
+            key = next(iter(self._data))
+            if key == keep:
+                self._data.move_to_end(key)
+                continue
+            evicted.append((key, self._data.pop(key)))
+        self.evictions += len(evicted)
+        return evicted
+
+    def _spill(self, evicted):
+        # Fuera del lock: escribir un snapshot puede tardar. Corre en la sesión
+        # que provocó el desalojo, así que un fallo (disco lleno, permisos) no
+        # se propaga: se cuenta y el dataset simplemente se pierde de memoria
+        for key, (df, _, _, spill, _) in evicted:
+            if spill and df is not None and not snapshot_path(key).exists():
+                try:
+                    write_snapshot(key, df)
+                except Exception:
+                    with self._lock:
+                        self.spill_errors += 1
+                    continue
+                with self._lock:
+                    self.spills += 1
+
+    def _memory_mb(self):
+        return float(sum(entry[1] + sum(size for _, size in entry[4].values()) for entry in self._data.values()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'derived': sum(len(entry[4]) for entry in self._data.values()),
+                'memory_mb': round(self._memory_mb(), 1),
+                'budget_mb': self.budget_mb,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'spills': self.spills,
+                'spill_errors': self.spill_errors,
+            }
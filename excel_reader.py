@@ -0,0 +1,213 @@
+import io
+from functools import lru_cache
+
+import openpyxl
+import pandas as pd
+import xlrd
+from openpyxl.utils.cell import column_index_from_string
+
+from ingest import (REQUIRED_COLUMNS, SMALL_INT_COLUMNS, canonical_columns, compact_frame, concat_chunks,
+                    detect_date_format, normalize_frame)
+
+try:
+    # Módulo interno de openpyxl: si cambia, se usa el recorrido estándar
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    WorkSheetParser = None
+
+# -----------------------------------------------------------------------------
+# LECTURA DE EXCEL POR FILAS CON PROYECCIÓN DE COLUMNAS
+# -----------------------------------------------------------------------------
+# El dashboard usa una docena de columnas, pero pd.read_excel convierte todas
+# las celdas de la hoja y arma la tabla completa antes de elegir. Aquí el
+# libro .xlsx se recorre fila a fila en modo de sólo lectura, sólo se
+# convierten las celdas de las columnas proyectadas y los tipos se fijan por
+# bloque. Los .xls (formato binario antiguo) se leen con xlrd, por columna
+EXCEL_COLUMNS = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'ARMADOR', 'LAT', 'LON', 'RESULTADO',
+                 'TIPO MUESTREO', 'AÑO', 'MES', 'DIA']
+NUMERIC_COLUMNS = ['LAT', 'LON']
+
+# Filas por bloque al recorrer una hoja .xlsx
+EXCEL_CHUNK_ROWS = 50_000
+
+
+def is_legacy_excel(name):
+    return name.lower().endswith('.xls')
+
+
+def workbook_sheets(name, data):
+    # Lista de hojas sin leer las celdas
+    if is_legacy_excel(name):
+        book = xlrd.open_workbook(file_contents=data, on_demand=True)
+        try:
+            return book.sheet_names()
+        finally:
+            book.release_resources()
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def read_excel_source(name, data, sheet=None):
+    # Hoja None = primera hoja; devuelve el DataFrame normalizado
+    if is_legacy_excel(name):
+        return _read_xls(data, sheet)
+    return _read_xlsx(data, sheet)
+
+
+def _projection(header):
+    # Posiciones y nombres canónicos de las columnas a leer. Si falta alguna
+    # columna crítica se leen todas, así los avisos de estructura muestran lo
+    # que trae el archivo
+    header = list(header)
+    while header and header[-1] is None:
+        header.pop()
+    names = canonical_columns([f"Unnamed: {i}" if value is None else value for i, value in enumerate(header)])
+    positions = list(range(len(names)))
+    if all(col in names for col in REQUIRED_COLUMNS):
+        positions = [i for i in positions if names[i] in EXCEL_COLUMNS]
+    return positions, [names[i] for i in positions]
+
+
+def _typed_block(records, names, date_format=None):
+    # Tipos fijados por bloque: fechas con el formato detectado en el primero,
+    # coordenadas como float y año/mes/día como enteros pequeños
+    block = pd.DataFrame.from_records(records, columns=names)
+    if date_format is None and 'FECHA MUESTREO' in block.columns:
+        date_format = detect_date_format(block['FECHA MUESTREO'])
+    block = normalize_frame(block, date_format)
+    for col in NUMERIC_COLUMNS:
+        if col in block.columns:
+            block[col] = pd.to_numeric(block[col], errors='coerce')
+    for col, dtype in SMALL_INT_COLUMNS.items():
+        if col in block.columns:
+            try:
+                block[col] = pd.to_numeric(block[col], errors='coerce').astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return block, date_format
+
+
+@lru_cache(maxsize=1024)
+def _column_index(letters):
+    return column_index_from_string(letters)
+
+
+if WorkSheetParser is not None:
+    class _ProjectedParser(WorkSheetParser):
+        # Parser de openpyxl que no convierte las celdas fuera de wanted (columnas
+        # desde 1; vacío = todas). wanted se completa al leer el encabezado
+
+        def __init__(self, *args, wanted, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.wanted = wanted
+
+        def parse_row(self, row):
+            counter = row.get('r')
+            self.row_counter = int(float(counter)) if counter else self.row_counter + 1
+            column, cells = 0, []
+            for element in row:
+                coordinate = element.get('r')
+                column = _column_index(coordinate.rstrip('0123456789')) if coordinate else column + 1
+                if not self.wanted or column in self.wanted:
+                    self.col_counter = column - 1
+                    cells.append(self.parse_cell(element))
+            return self.row_counter, cells
+else:
+    _ProjectedParser = None
+
+
+def _xlsx_rows(workbook, worksheet, wanted):
+    # Filas no vacías como {columna: valor}
+    parser = None
+    if _ProjectedParser is not None:
+        try:
+            source = worksheet._get_source()
+            parser = _ProjectedParser(source, workbook.shared_strings, data_only=True, epoch=workbook.epoch,
+                                      date_formats=workbook._date_formats,
+                                      timedelta_formats=workbook._timedelta_formats, wanted=wanted)
+        except (AttributeError, TypeError):
+            parser = None
+    if parser is None:
+        # Otra versión de openpyxl: recorrido estándar de sólo lectura
+        for values in worksheet.iter_rows(values_only=True):
+            row = {i: value for i, value in enumerate(values, 1)
+                   if value is not None and (not wanted or i in wanted)}
+            if row:
+                yield row
+        return
+    with source:
+        for _, cells in parser.parse():
+            row = {cell['column']: cell['value'] for cell in cells if cell['value'] is not None}
+            if row:
+                yield row
+
+
+def _read_xlsx(data, sheet):
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook.worksheets[0] if sheet is None else workbook[sheet]
+        wanted = set()
+        rows = _xlsx_rows(workbook, worksheet, wanted)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        positions, names = _projection(header.get(i) for i in range(1, max(header) + 1))
+        columns = [position + 1 for position in positions]
+        wanted.update(columns)
+
+        blocks, records, date_format = [], [], None
+        for row in rows:
+            record = tuple(map(row.get, columns))
+            if any(value is not None for value in record):
+                records.append(record)
+            if len(records) == EXCEL_CHUNK_ROWS:
+                block, date_format = _typed_block(records, names, date_format)
+                blocks.append(compact_frame(block))
+                records = []
+        if records or not blocks:
+            blocks.append(compact_frame(_typed_block(records, names, date_format)[0]))
+        return concat_chunks(blocks)
+    finally:
+        workbook.close()
+
+
+def _xls_value(book, ctype, value):
+    if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if ctype == xlrd.XL_CELL_DATE:
+        try:
+            return xlrd.xldate.xldate_as_datetime(value, book.datemode)
+        except (ValueError, OverflowError, xlrd.xldate.XLDateError):
+            return None
+    if ctype == xlrd.XL_CELL_NUMBER and value.is_integer():
+        return int(value)
+    if ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(value)
+    return value
+
+
+def _read_xls(data, sheet):
+    # xlrd carga la hoja entera (un .xls tiene a lo más 65.536 filas), pero
+    # sólo se convierten las columnas proyectadas
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        worksheet = book.sheet_by_index(0) if sheet is None else book.sheet_by_name(sheet)
+        first = next((r for r in range(worksheet.nrows)
+                      if any(ctype not in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK)
+                             for ctype in worksheet.row_types(r))), None)
+        if first is None:
+            return pd.DataFrame()
+        header = [_xls_value(book, ctype, value)
+                  for ctype, value in zip(worksheet.row_types(first), worksheet.row_values(first))]
+        positions, names = _projection(header)
+        values = [[_xls_value(book, ctype, value)
+                   for ctype, value in zip(worksheet.col_types(position, first + 1),
+                                           worksheet.col_values(position, first + 1))]
+                  for position in positions]
+        records = [record for record in zip(*values) if any(value is not None for value in record)]
+        return _typed_block(records, names)[0]
+    finally:
+        book.release_resources()
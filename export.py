@@ -0,0 +1,119 @@
+import gzip
+import io
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+from snapshot_cache import arrow_safe
+
+# -----------------------------------------------------------------------------
+# EXPORTACIÓN POR BLOQUES
+# -----------------------------------------------------------------------------
+# Formato -> (extensión, tipo MIME)
+EXPORT_FORMATS = {
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel (XLSX)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+EXPORT_CHUNK_ROWS = 50_000
+
+# Límite de filas por hoja de Excel (sin contar el encabezado)
+XLSX_MAX_ROWS = 1_048_575
+
+
+def iter_row_chunks(df, row_ids, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(row_ids), chunk_rows):
+        yield df.take(row_ids[start:start + chunk_rows])
+
+
+# Los escritores reciben bloques de filas y un DataFrame vacío con las columnas
+# y tipos del resultado, así sirven tanto para el DataFrame en memoria como
+# para consultas por bloques del backend SQL
+def _write_csv_gzip(chunks, template, out):
+    with gzip.GzipFile(fileobj=out, mode='wb') as gz:
+        with io.TextIOWrapper(gz, encoding='utf-8', newline='') as text:
+            text.write(','.join(map(str, template.columns)) + '\n')
+            for part in chunks:
+                part.to_csv(text, header=False, index=False)
+
+
+def _write_parquet(chunks, template, out):
+    # Una columna de texto vacía (object) se infiere como tipo null y el cast
+    # del primer bloque con texto fallaría: se declara como string
+    schema = pa.Schema.from_pandas(arrow_safe(template), preserve_index=False)
+    schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                        for field in schema], metadata=schema.metadata)
+    with pq.ParquetWriter(out, schema) as writer:
+        for part in chunks:
+            table = pa.Table.from_pandas(arrow_safe(part), preserve_index=False)
+            writer.write_table(table.cast(schema))
+
+
+def _xlsx_value(value):
+    if value is pd.NaT or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def _write_xlsx(chunks, template, out):
+    # Libro en modo write_only: las filas se vuelcan al archivo a medida que se
+    # agregan; si se supera el límite de Excel se continúa en otra hoja
+    workbook = Workbook(write_only=True)
+    header = list(map(str, template.columns))
+    sheet, sheet_rows = None, XLSX_MAX_ROWS
+    for part in chunks:
+        for row in part.itertuples(index=False, name=None):
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"datos_{len(workbook.worksheets) + 1}")
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append([_xlsx_value(value) for value in row])
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet('datos_1').append(header)
+    workbook.save(out)
+
+
+EXPORT_WRITERS = {
+    'CSV (gzip)': _write_csv_gzip,
+    'Parquet': _write_parquet,
+    'Excel (XLSX)': _write_xlsx,
+}
+
+
+def export_chunks(chunks, template, export_format):
+    # Se llama sólo cuando el usuario pide la descarga. El archivo se arma en
+    # disco y se entrega abierto en modo 'rb': st.download_button sólo acepta
+    # bytes, BytesIO o lectores de archivo (no SpooledTemporaryFile)
+    with tempfile.NamedTemporaryFile(suffix='.export', delete=False) as out:
+        path = out.name
+        try:
+            EXPORT_WRITERS[export_format](chunks, template, out)
+        except BaseException:
+            out.close()
+            os.unlink(path)
+            raise
+    reader = open(path, 'rb')
+    try:
+        # En POSIX el archivo abierto sigue legible después de borrarlo
+        os.unlink(path)
+    except OSError:
+        pass
+    return reader
+
+
+def export_rows(df, row_ids, export_format):
+    return export_chunks(iter_row_chunks(df, row_ids), df.head(0), export_format)
+
+
+def export_query(backend, selection, export_format):
+    # Exportación desde el backend SQL, bloque a bloque; selection son los
+    # filtros (criteria, fecha_inicio, fecha_fin, bbox) como diccionario
+    return export_chunks(backend.iter_rows(**selection),
+                         backend.empty_frame(), export_format)
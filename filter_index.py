@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# ÍNDICE DE FILTROS
+# -----------------------------------------------------------------------------
+FILTER_COLUMNS = ['WELLBOAT', 'RESULTADO', 'TIPO MUESTREO', 'AÑO']
+DATE_COLUMN = 'FECHA MUESTREO'
+
+
+class FilterIndex:
+    # Se construye una vez por dataset. Cada columna categórica guarda sus
+    # códigos por fila y una lista de filas por valor; las fechas se guardan
+    # ordenadas para resolver rangos con búsqueda binaria.
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.row_dtype = np.int32 if self.n_rows < 2 ** 31 else np.int64
+        self.codes = {}
+        self.value_codes = {}
+        self._order = {}
+        self._offsets = {}
+
+        for col in FILTER_COLUMNS:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col], sort=True)
+            codes = codes.astype(np.int32)
+            # Orden estable: dentro de cada valor las filas quedan ascendentes
+            order = np.argsort(codes, kind='stable').astype(self.row_dtype)
+            self.codes[col] = codes
+            self.value_codes[col] = {value: code for code, value in enumerate(uniques.tolist())}
+            self._order[col] = order
+            self._offsets[col] = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+        self.dates = None
+        if DATE_COLUMN in df.columns:
+            self.dates = df[DATE_COLUMN].to_numpy()
+            # NaT queda al final del orden y se excluye de los rangos
+            n_valid = int(df[DATE_COLUMN].notna().sum())
+            self._date_order = np.argsort(self.dates, kind='stable')[:n_valid].astype(self.row_dtype)
+            self._sorted_dates = self.dates[self._date_order]
+
+    def rows_for(self, col, value):
+        code = self.value_codes.get(col, {}).get(value)
+        if code is None:
+            return np.empty(0, dtype=self.row_dtype)
+        start, end = self._offsets[col][code], self._offsets[col][code + 1]
+        return self._order[col][start:end]
+
+    def _date_bounds(self, fecha_inicio, fecha_fin):
+        unit = self._sorted_dates.dtype
+        lo = 0 if fecha_inicio is None else np.searchsorted(
+            self._sorted_dates, pd.Timestamp(fecha_inicio).to_datetime64().astype(unit), side='left')
+        hi = len(self._sorted_dates) if fecha_fin is None else np.searchsorted(
+            self._sorted_dates, pd.Timestamp(fecha_fin).to_datetime64().astype(unit), side='right')
+        return lo, max(lo, hi)
+
+    def select(self, criteria, fecha_inicio=None, fecha_fin=None):
+        # Devuelve los ids de fila (ascendentes) que cumplen todos los filtros.
+        # Se parte del conjunto candidato más pequeño y el resto de condiciones
+        # se verifica sólo sobre esos candidatos.
+        candidates = []
+        for col, value in criteria.items():
+            candidates.append((len(self.rows_for(col, value)), 'col', col, value))
+
+        use_dates = self.dates is not None and (fecha_inicio is not None or fecha_fin is not None)
+        if use_dates:
+            lo, hi = self._date_bounds(fecha_inicio, fecha_fin)
+            candidates.append((hi - lo, 'date', None, None))
+
+        if not candidates:
+            return np.arange(self.n_rows, dtype=self.row_dtype)
+
+        candidates.sort(key=lambda c: c[0])
+        _, kind, col, value = candidates[0]
+        if kind == 'col':
+            row_ids = self.rows_for(col, value)
+        else:
+            row_ids = np.sort(self._date_order[lo:hi])
+
+        for _, kind, col, value in candidates[1:]:
+            if len(row_ids) == 0:
+                break
+            if kind == 'col':
+                row_ids = row_ids[self.codes[col][row_ids] == self.value_codes[col][value]]
+            elif hi == lo:
+                row_ids = row_ids[:0]
+            else:
+                dates = self.dates[row_ids]
+                row_ids = row_ids[(dates >= self._sorted_dates[lo]) & (dates <= self._sorted_dates[hi - 1])]
+        return row_ids
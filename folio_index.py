@@ -0,0 +1,55 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# -----------------------------------------------------------------------------
+# ÍNDICE ORDENADO DE FOLIO
+# -----------------------------------------------------------------------------
+# Claves normalizadas y ordenadas en un buffer Arrow (sin un objeto Python por
+# fila) más la permutación a filas: búsquedas exactas y por prefijo con dos
+# búsquedas binarias, sin recorrer los datos
+FOLIO_MAX_RESULTS = 200
+
+# Mayor que cualquier carácter: clave + SENTINEL acota todas las claves con ese prefijo
+SENTINEL = '\U0010ffff'
+
+
+def normalize_folio(text):
+    return str(text).strip().upper()
+
+
+class FolioIndex:
+
+    def __init__(self, series):
+        keys = series.where(series.isna(), series.astype(str)).str.strip().str.upper()
+        keys = pa.array(keys, type=pa.large_string(), from_pandas=True)
+        valid = np.flatnonzero(pc.is_valid(keys).to_numpy(zero_copy_only=False))
+        keys = keys.take(valid)
+        # Orden por bytes UTF-8, que coincide con el orden de los str de Python
+        order = pc.sort_indices(keys).to_numpy()
+        self._rows = valid[order]
+        self._keys = keys.take(order)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _bisect(self, target):
+        # Primera posición cuya clave es >= target
+        lo, hi = 0, len(self._keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._keys[mid].as_py() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, text, limit=FOLIO_MAX_RESULTS):
+        # Coincidencia exacta primero (es la menor clave con ese prefijo) y luego
+        # el resto del prefijo en orden. Devuelve (ids de fila, total de coincidencias)
+        key = normalize_folio(text)
+        if not key:
+            return np.empty(0, dtype=np.int64), 0
+        lo = self._bisect(key)
+        hi = self._bisect(key + SENTINEL)
+        return self._rows[lo:min(hi, lo + limit)], hi - lo
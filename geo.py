@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# ÍNDICE ESPACIAL Y GRILLA DEL MAPA
+# -----------------------------------------------------------------------------
+# Las muestras se agrupan en celdas de una grilla lat/lon: el mapa recibe una
+# fila por celda con datos, nunca una por muestra
+LAT_COLUMN = 'LAT'
+LON_COLUMN = 'LON'
+
+# Tamaño de celda (grados) del índice espacial
+INDEX_CELL_DEG = 0.1
+
+# Celdas posibles del mapa (grados), de gruesa a fina; la automática es la más
+# fina que deja el rectángulo visible bajo MAX_MAP_BINS celdas
+GRID_STEPS = [2.0, 1.0, 0.5, 0.25, 0.1, 0.05, 0.02, 0.01]
+MAX_MAP_BINS = 4000
+
+
+def coordinates(df):
+    # Coordenadas numéricas; vacíos, textos y valores fuera de rango quedan NaN
+    lat = pd.to_numeric(df[LAT_COLUMN], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    lon = pd.to_numeric(df[LON_COLUMN], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    invalid = ~((np.abs(lat) <= 90) & (np.abs(lon) <= 180))
+    lat[invalid] = np.nan
+    lon[invalid] = np.nan
+    return lat, lon
+
+
+def outer_bounds(lat_min, lat_max, lon_min, lon_max, digits=2):
+    # Rectángulo redondeado hacia afuera (límites de los sliders)
+    scale = 10 ** digits
+    return ((math.floor(lat_min * scale) / scale, math.ceil(lat_max * scale) / scale),
+            (math.floor(lon_min * scale) / scale, math.ceil(lon_max * scale) / scale))
+
+
+def _cell_key(cell_lat, cell_lon):
+    # Clave entera única por celda (la longitud desplazada para que quede positiva)
+    return cell_lat * 100_000 + (cell_lon + 50_000)
+
+
+def _cell_coords(keys):
+    return keys // 100_000, keys % 100_000 - 50_000
+
+
+def auto_grid_step(bbox):
+    lat_min, lat_max, lon_min, lon_max = bbox
+    for step in reversed(GRID_STEPS):
+        cells = (math.floor(lat_max / step) - math.floor(lat_min / step) + 1) * \
+                (math.floor(lon_max / step) - math.floor(lon_min / step) + 1)
+        if cells <= MAX_MAP_BINS:
+            return step
+    return GRID_STEPS[0]
+
+
+class SpatialIndex:
+    # Listas de filas por celda (como FilterIndex): un rectángulo sólo revisa
+    # las filas de las celdas que toca
+
+    def __init__(self, lat, lon, cell_deg=INDEX_CELL_DEG):
+        self.lat = lat
+        self.lon = lon
+        self.cell_deg = cell_deg
+        valid = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+        self.n_valid = len(valid)
+        self.extent = None
+        if self.n_valid:
+            self.extent = (lat[valid].min(), lat[valid].max(), lon[valid].min(), lon[valid].max())
+
+        cell_lat = np.floor(lat[valid] / cell_deg).astype(np.int64)
+        cell_lon = np.floor(lon[valid] / cell_deg).astype(np.int64)
+        codes, cells = pd.factorize(_cell_key(cell_lat, cell_lon))
+        cell_lat, cell_lon = _cell_coords(np.asarray(cells))
+        self._cell_lat = cell_lat * cell_deg
+        self._cell_lon = cell_lon * cell_deg
+        order = np.argsort(codes, kind='stable')
+        self._rows = valid[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(cells)))])
+
+    def rows_in_bbox(self, bbox):
+        # Filas (ordenadas) dentro del rectángulo (lat_min, lat_max, lon_min, lon_max)
+        lat_min, lat_max, lon_min, lon_max = bbox
+        touched = np.flatnonzero(
+            (self._cell_lat <= lat_max) & (self._cell_lat + self.cell_deg >= lat_min)
+            & (self._cell_lon <= lon_max) & (self._cell_lon + self.cell_deg >= lon_min)
+        )
+        if not len(touched):
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate([self._rows[self._offsets[c]:self._offsets[c + 1]] for c in touched])
+        lat, lon = self.lat[rows], self.lon[rows]
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        return np.sort(rows[inside])
+
+
+def bin_samples(lat, lon, positive, step):
+    # Conteo de muestras y positivos por celda; LAT/LON es el centro de la celda
+    valid = ~np.isnan(lat) & ~np.isnan(lon)
+    cell_lat = np.floor(lat[valid] / step).astype(np.int64)
+    cell_lon = np.floor(lon[valid] / step).astype(np.int64)
+    return _bins_frame(cell_lat, cell_lon, np.ones(len(cell_lat), dtype=np.int64),
+                       positive[valid].astype(np.int64), step)
+
+
+def _bins_frame(cell_lat, cell_lon, muestras, positivos, step):
+    codes, cells = pd.factorize(_cell_key(cell_lat, cell_lon))
+    cell_lat, cell_lon = _cell_coords(np.asarray(cells))
+    bins = pd.DataFrame({
+        'LAT': (cell_lat + 0.5) * step,
+        'LON': (cell_lon + 0.5) * step,
+        'Muestras': np.bincount(codes, weights=muestras, minlength=len(cells)).astype(np.int64),
+        'Positivos': np.bincount(codes, weights=positivos, minlength=len(cells)).astype(np.int64),
+    })
+    bins['Tasa'] = bins['Positivos'] / bins['Muestras'] * 100
+    return bins
+
+
+def grouped_bins(cells, step):
+    # Celdas ya agregadas (ej. por SQL): columnas fila, columna, Muestras, Positivos
+    return _bins_frame(cells['fila'].to_numpy(np.int64), cells['columna'].to_numpy(np.int64),
+                       cells['Muestras'].to_numpy(np.int64), cells['Positivos'].to_numpy(np.int64), step)
+
+
+def map_view(bbox):
+    # Centro y zoom aproximado para que el rectángulo llene el mapa
+    lat_min, lat_max, lon_min, lon_max = bbox
+    span = max(lat_max - lat_min, lon_max - lon_min, 0.01)
+    zoom = max(0.0, min(12.0, math.log2(360 / span) - 1))
+    return {'lat': (lat_min + lat_max) / 2, 'lon': (lon_min + lon_max) / 2}, zoom
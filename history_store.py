@@ -0,0 +1,282 @@
+import json
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin flock, el histórico sólo admite un proceso servidor
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, build_cube
+from ingest import compact_frame
+from snapshot_cache import (SNAPSHOT_DIR, SNAPSHOT_VERSION, read_snapshot, read_snapshot_rows, snapshot_path,
+                            write_json, write_snapshot)
+
+# -----------------------------------------------------------------------------
+# HISTÓRICO INCREMENTAL POR FOLIO
+# -----------------------------------------------------------------------------
+# Cada extracto nuevo se fusiona con el histórico guardado: sólo se escriben
+# las filas nuevas o cambiadas (un segmento por fusión), el cubo de conteos
+# se actualiza sumando/restando celdas y el índice FOLIO -> huella de la fila
+# se actualiza con el delta, sin reconstruirlos
+HISTORY_PREFIX = 'historico'
+KEY_COLUMN = 'FOLIO'
+
+# Con más segmentos que esto se reescribe el histórico en uno solo
+MAX_SEGMENTS = 12
+
+_merge_lock = threading.Lock()
+
+
+def manifest_path():
+    return SNAPSHOT_DIR / f"{HISTORY_PREFIX}-v{SNAPSHOT_VERSION}.json"
+
+
+def lock_path():
+    return SNAPSHOT_DIR / f"{HISTORY_PREFIX}-v{SNAPSHOT_VERSION}.lock"
+
+
+@contextmanager
+def _history_lock():
+    # El manifiesto, los segmentos y el índice se comparten entre sesiones y
+    # procesos: la lectura-modificación-escritura de una fusión va bajo un
+    # lock de archivo además del lock entre hilos
+    with _merge_lock:
+        if fcntl is None:
+            yield
+            return
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        with open(lock_path(), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_manifest():
+    path = manifest_path()
+    if not path.exists():
+        return {'generation': 0, 'segments': [], 'rows': 0, 'sources': {}}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def history_key(generation):
+    return f"{HISTORY_PREFIX}-{generation}"
+
+
+def load_history(manifest):
+    # Segmentos en orden de escritura: si un FOLIO se actualizó, vale la última
+    # versión. Con el índice de FOLIO sólo se leen las filas vigentes
+    if not manifest['segments']:
+        return None
+    index = read_snapshot(manifest['index']) if 'index' in manifest else None
+    if index is None:
+        segments = [read_snapshot(key) for key in manifest['segments']]
+        df = pd.concat(segments, ignore_index=True) if len(segments) > 1 else segments[0]
+        if len(segments) > 1:
+            df = df.drop_duplicates(KEY_COLUMN, keep='last').reset_index(drop=True)
+        return compact_frame(df)
+    segment_of = index['segmento'].to_numpy()
+    row_of = index['fila'].to_numpy()
+    parts = []
+    for position, key in enumerate(manifest['segments']):
+        rows = np.sort(row_of[segment_of == position])
+        if len(rows):
+            parts.append(read_snapshot_rows(key, rows))
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return compact_frame(df)
+
+
+def load_history_cube(manifest):
+    cube = read_snapshot(manifest['cube'])
+    if 'FECHA' in cube.columns:
+        cube['MES'] = cube['FECHA'].dt.to_period('M')
+    return cube
+
+
+def row_hashes(df, columns):
+    # Huella del contenido de cada fila sobre una representación de texto, para
+    # que el mismo dato compare igual sea categórico, entero pequeño o texto
+    text = pd.DataFrame({
+        col: (df[col].astype(str).where(df[col].notna(), '') if col in df.columns else '')
+        for col in columns
+    }, index=df.index)
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+def folio_keys(folios):
+    # Huella de 64 bits de cada FOLIO: el índice ordenado por ella se consulta
+    # con búsqueda binaria, sin armar una tabla hash sobre todo el histórico
+    return pd.util.hash_pandas_object(pd.Series(folios).astype(str), index=False).to_numpy()
+
+
+def _index_entries(keys, hashes, segment, rows):
+    return pd.DataFrame({'clave': keys, 'huella': hashes,
+                         'segmento': np.full(len(keys), segment, dtype=np.int32),
+                         'fila': np.asarray(rows, dtype=np.int64)})
+
+
+def _update_index(index, entries):
+    # Ambos ordenados por clave; a igual clave vale la entrada nueva
+    combined = entries if index is None else pd.concat([index, entries], ignore_index=True)
+    combined = combined.iloc[np.argsort(combined['clave'].to_numpy(), kind='stable')]
+    keys = combined['clave'].to_numpy()
+    last = np.append(keys[1:] != keys[:-1], True)
+    return combined[last].reset_index(drop=True)
+
+
+def build_index(manifest, extra_columns=()):
+    # Índice FOLIO -> (huella de la fila, segmento, fila) leyendo todos los
+    # segmentos. Sólo para manifiestos anteriores al índice o cuando un extracto
+    # trae columnas nuevas (las huellas cubren todas las columnas)
+    segments = [read_snapshot(key) for key in manifest['segments']]
+    columns = list(dict.fromkeys([col for segment in segments for col in segment.columns] + list(extra_columns)))
+    index = None
+    for position, segment in enumerate(segments):
+        entries = _index_entries(folio_keys(segment[KEY_COLUMN]), row_hashes(segment, columns),
+                                 position, np.arange(len(segment)))
+        index = _update_index(index, entries.iloc[np.argsort(entries['clave'].to_numpy(), kind='stable')])
+    return index, columns
+
+
+def _combine_cubes(cube, *deltas):
+    # Suma celda a celda; las celdas que quedan en cero se eliminan
+    parts = [cube.drop(columns='MES', errors='ignore')]
+    parts += [delta.drop(columns='MES', errors='ignore') for delta in deltas if len(delta)]
+    if len(parts) == 1:
+        return parts[0]
+    keys = [col for col in ['FECHA'] + CUBE_DIMENSIONS if col in parts[0].columns]
+    for i, part in enumerate(parts):
+        parts[i] = part.astype({col: object for col in keys if col != 'FECHA'})
+    combined = pd.concat(parts, ignore_index=True)
+    combined = combined.groupby(keys, dropna=False, sort=False)['Cantidad'].sum().reset_index()
+    combined = combined[combined['Cantidad'] != 0]
+    if 'FECHA' in combined.columns:
+        combined = combined.sort_values('FECHA', kind='stable')
+    combined['Cantidad'] = combined['Cantidad'].astype(np.int64)
+    return combined.reset_index(drop=True)
+
+
+def merge_into_history(new_df, source_key, history=None, generation=None):
+    # Fusiona un extracto normalizado. history es el DataFrame del histórico
+    # de la generación indicada si ya está en memoria: sólo se usa al compactar
+    # y se descarta si otra fusión avanzó la generación. El cruce por FOLIO usa
+    # el índice persistido, así el costo depende del extracto y no del histórico.
+    # Devuelve (reporte, manifiesto)
+    with _history_lock():
+        manifest = read_manifest()
+        if source_key in manifest['sources']:
+            return manifest['sources'][source_key], manifest
+        if history is not None and generation != manifest['generation']:
+            history = None
+
+        index = read_snapshot(manifest['index']) if 'index' in manifest else None
+        columns = manifest.get('columns', [])
+        new_columns = [col for col in new_df.columns if col not in columns]
+        if not manifest['segments']:
+            index, columns = None, list(new_df.columns)
+        rebuilt = bool(manifest['segments']) and (index is None or bool(new_columns))
+        if rebuilt:
+            index, columns = build_index(manifest, new_df.columns)
+
+        # Filas sin FOLIO o con un FOLIO repetido con distinto contenido dentro
+        # del mismo extracto: no se puede decidir cuál vale, quedan fuera
+        new_df = new_df.reset_index(drop=True)
+        new_hashes = row_hashes(new_df, columns)
+        folios = new_df[KEY_COLUMN].astype(str).where(new_df[KEY_COLUMN].notna())
+        variants = pd.DataFrame({'folio': folios, 'hash': new_hashes}).groupby('folio')['hash'].nunique()
+        conflict = folios.isna().to_numpy() | folios.map(variants).gt(1).to_numpy()
+
+        # Repetidos exactos dentro del extracto cuentan como duplicados
+        repeated = pd.Series(folios).duplicated().to_numpy() & ~conflict
+        candidates = np.flatnonzero(~conflict & ~repeated)
+        candidate_keys = folio_keys(folios.iloc[candidates])
+
+        matched = np.zeros(len(candidates), dtype=bool)
+        changed = np.zeros(len(candidates), dtype=bool)
+        positions = np.zeros(len(candidates), dtype=np.int64)
+        if index is not None and len(index):
+            index_keys = index['clave'].to_numpy()
+            positions = np.minimum(np.searchsorted(index_keys, candidate_keys), len(index_keys) - 1)
+            matched = index_keys[positions] == candidate_keys
+            changed[matched] = index['huella'].to_numpy()[positions[matched]] != new_hashes[candidates[matched]]
+
+        inserted_rows = candidates[~matched]
+        updated_rows = candidates[matched & changed]
+        report = {
+            'insertados': int(len(inserted_rows)),
+            'actualizados': int(len(updated_rows)),
+            'duplicados': int(repeated.sum() + (matched & ~changed).sum()),
+            'conflictos': int(conflict.sum()),
+        }
+
+        delta_rows = np.sort(np.concatenate([inserted_rows, updated_rows]))
+        delta = new_df.take(delta_rows)
+        if len(delta):
+            delta = compact_frame(delta.copy())
+            generation = manifest['generation'] + 1
+
+            # Cubo: + celdas nuevas, - celdas de la versión anterior de cada
+            # fila actualizada (leídas de su segmento, sólo esas filas)
+            delta_cube = build_cube(delta)
+            if 'cube' in manifest:
+                previous = index.iloc[positions[matched & changed]]
+                removed_rows = [read_snapshot_rows(manifest['segments'][segment], group['fila'].to_numpy())
+                                for segment, group in previous.groupby('segmento')]
+                removed = build_cube(pd.concat(removed_rows, ignore_index=True)) if removed_rows else delta_cube.head(0)
+                removed['Cantidad'] = -removed['Cantidad']
+                cube = _combine_cubes(load_history_cube(manifest), delta_cube, removed)
+            else:
+                cube = _combine_cubes(delta_cube)
+
+            old_files = []
+            segment_key = f"{HISTORY_PREFIX}-seg-{generation:05d}"
+            if len(manifest['segments']) >= MAX_SEGMENTS:
+                # Compactación: un solo segmento con el histórico vigente
+                if history is None:
+                    history = load_history(manifest)
+                full = pd.concat([history, delta], ignore_index=True).drop_duplicates(KEY_COLUMN, keep='last')
+                full = full.reset_index(drop=True)
+                write_snapshot(segment_key, full)
+                entries = _index_entries(folio_keys(full[KEY_COLUMN]), row_hashes(full, columns), 0,
+                                         np.arange(len(full)))
+                index = _update_index(None, entries.iloc[np.argsort(entries['clave'].to_numpy(), kind='stable')])
+                old_files = list(manifest['segments'])
+                manifest['segments'] = [segment_key]
+            else:
+                write_snapshot(segment_key, delta)
+                entries = _index_entries(folio_keys(delta[KEY_COLUMN]), new_hashes[delta_rows],
+                                         len(manifest['segments']), np.arange(len(delta)))
+                index = _update_index(index, entries.iloc[np.argsort(entries['clave'].to_numpy(), kind='stable')])
+                manifest['segments'].append(segment_key)
+
+            cube_key = f"{HISTORY_PREFIX}-cubo-{generation:05d}"
+            write_snapshot(cube_key, cube)
+            index_key = f"{HISTORY_PREFIX}-indice-{generation:05d}"
+            write_snapshot(index_key, index)
+            old_files += [manifest[name] for name in ['cube', 'index'] if name in manifest]
+            manifest['cube'] = cube_key
+            manifest['index'] = index_key
+            manifest['columns'] = columns
+            manifest['generation'] = generation
+            manifest['rows'] = len(index)
+
+            manifest['sources'][source_key] = report
+            write_json(manifest_path(), manifest)
+            for key in old_files:
+                snapshot_path(key).unlink(missing_ok=True)
+        else:
+            if rebuilt:
+                index_key = f"{HISTORY_PREFIX}-indice-{manifest['generation']:05d}"
+                write_snapshot(index_key, index)
+                manifest['index'] = index_key
+                manifest['columns'] = columns
+            manifest['sources'][source_key] = report
+            write_json(manifest_path(), manifest)
+
+        return report, manifest
@@ -0,0 +1,204 @@
+import functools
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# NORMALIZACIÓN E INGESTA POR BLOQUES
+# -----------------------------------------------------------------------------
+# Filas por bloque al leer CSV grandes
+CSV_CHUNK_ROWS = 100_000
+
+# Columnas mínimas para guardar un snapshot del dataset
+REQUIRED_COLUMNS = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'RESULTADO']
+
+# Formatos de fecha de texto que se prueban, en orden, sobre una muestra
+DATE_FORMATS = ['ISO8601', '%Y%m%d', '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y', '%d-%m-%Y %H:%M:%S']
+EXCEL_SERIAL = 'excel_serial'
+# Columna object que ya trae datetime/date (así entrega openpyxl las fechas):
+# se convierte directo, sin pasar por texto
+DATE_OBJECTS = 'objetos_fecha'
+DATE_SAMPLE_SIZE = 200
+# Proporción mínima de la muestra que debe calzar con un formato (tolera
+# algunas celdas sucias sin caer en la inferencia fila a fila)
+DATE_MATCH_RATIO = 0.95
+
+# Origen de los números de serie de fecha de Excel y rango plausible
+# (1 = 1900-01-01, 2958465 = 9999-12-31): un número fuera de él, como
+# 20160911, es una fecha aaaammdd y no un serial
+EXCEL_EPOCH = '1899-12-30'
+EXCEL_SERIAL_RANGE = (1, 2958465)
+
+
+# Nombres canónicos: 'Fecha muestreo' o 'WELLBOAT ' en otra hoja son la misma columna
+KNOWN_COLUMNS = ['FOLIO', 'FECHA MUESTREO', 'WELLBOAT', 'ARMADOR', 'MUESTREADOR', 'ANALISTA',
+                 'LAT', 'LON', 'RESULTADO', 'TIPO MUESTREO', 'DIA', 'MES', 'AÑO']
+
+
+def _column_key(name):
+    return ' '.join(str(name).split()).upper()
+
+
+_CANONICAL = {_column_key(col): col for col in KNOWN_COLUMNS}
+
+
+def canonical_columns(columns):
+    renamed, seen = [], set()
+    for col in columns:
+        name = _CANONICAL.get(_column_key(col), str(col).strip())
+        # Si dos columnas caen en el mismo nombre se deja la original
+        if name in seen:
+            name = str(col)
+        seen.add(name)
+        renamed.append(name)
+    return renamed
+
+
+def _date_text(series):
+    # Números enteros (ej. 20160911 leído como int64 o float) como texto sin '.0'
+    if pd.api.types.is_numeric_dtype(series):
+        numbers = pd.to_numeric(series, errors='coerce')
+        return numbers.where(numbers % 1 == 0).astype('Int64').astype(str)
+    return series.astype(str).str.strip()
+
+
+def _excel_serials(numbers):
+    low, high = EXCEL_SERIAL_RANGE
+    return numbers.between(low, high)
+
+
+def detect_date_format(series):
+    # Detecta el formato una sola vez a partir de una muestra de valores únicos
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return None
+
+    sample = series.dropna().drop_duplicates().head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    if pd.api.types.infer_dtype(sample, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return DATE_OBJECTS
+    numbers = pd.to_numeric(sample, errors='coerce')
+    if _excel_serials(numbers).mean() >= DATE_MATCH_RATIO:
+        return EXCEL_SERIAL
+
+    sample = _date_text(sample)
+    for date_format in DATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=date_format, errors='coerce')
+        if parsed.notna().mean() >= DATE_MATCH_RATIO:
+            return date_format
+    return None
+
+
+def parse_dates(series, date_format=None):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if date_format == DATE_OBJECTS:
+        return pd.to_datetime(series, errors='coerce')
+    if date_format == EXCEL_SERIAL:
+        serials = pd.to_numeric(series, errors='coerce')
+        serials = serials.where(_excel_serials(serials))
+        return pd.to_datetime(serials, unit='D', origin=EXCEL_EPOCH, errors='coerce')
+    if date_format is not None:
+        return pd.to_datetime(_date_text(series), format=date_format, errors='coerce')
+    # Sin formato reconocible: inferencia de pandas (más lenta)
+    if pd.api.types.is_numeric_dtype(series):
+        series = _date_text(series)
+    return pd.to_datetime(series, errors='coerce')
+
+
+def normalize_frame(df, date_format=None):
+    # Normalizar nombres de columnas (eliminar espacios extra)
+    df.columns = df.columns.str.strip()
+
+    # Convertir fecha a datetime con un formato detectado una sola vez
+    if 'FECHA MUESTREO' in df.columns:
+        if date_format is None:
+            date_format = detect_date_format(df['FECHA MUESTREO'])
+        df['FECHA MUESTREO'] = parse_dates(df['FECHA MUESTREO'], date_format)
+
+    # Normalizar resultados y tipo de muestreo (mayúsculas/minúsculas)
+    if 'RESULTADO' in df.columns:
+        df['RESULTADO'] = df['RESULTADO'].astype(str).str.strip().str.upper()
+    if 'TIPO MUESTREO' in df.columns:
+        df['TIPO MUESTREO'] = df['TIPO MUESTREO'].astype(str).str.strip().str.upper()
+
+    # Rellenar valores NaN en columnas críticas
+    if 'WELLBOAT' in df.columns:
+        df['WELLBOAT'] = df['WELLBOAT'].fillna('NO ESPECIFICADO')
+
+    # Extraer año, mes, día si no existen las columnas separadas
+    if 'FECHA MUESTREO' in df.columns:
+        if 'AÑO' not in df.columns:
+            df['AÑO'] = df['FECHA MUESTREO'].dt.year
+        if 'MES' not in df.columns:
+            df['MES'] = df['FECHA MUESTREO'].dt.month
+        if 'DIA' not in df.columns:
+            df['DIA'] = df['FECHA MUESTREO'].dt.day
+
+    return df
+
+
+def iter_csv_chunks(source, chunk_rows=CSV_CHUNK_ROWS):
+    # Cada bloque se normaliza por separado: el pico de memoria queda acotado
+    # al tamaño del bloque y no a varias copias del archivo completo
+    # El formato de fecha se detecta en el primer bloque y se reutiliza; los
+    # encabezados se llevan a su nombre canónico como en las demás fuentes
+    date_format = None
+    with pd.read_csv(source, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk.columns = canonical_columns(chunk.columns)
+            if date_format is None and 'FECHA MUESTREO' in chunk.columns:
+                date_format = detect_date_format(chunk['FECHA MUESTREO'])
+            yield normalize_frame(chunk, date_format)
+
+
+def concat_chunks(chunks):
+    # Con bloques ya compactos se unifican las categorías antes de unir: con
+    # categorías distintas pandas devolvería texto por fila
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    for col in chunks[0].columns:
+        parts = [chunk[col] for chunk in chunks if col in chunk.columns]
+        if len(parts) < len(chunks) or not all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            continue
+        categories = functools.reduce(lambda a, b: a.union(b, sort=False), [part.cat.categories for part in parts])
+        chunks = [chunk.assign(**{col: chunk[col].cat.set_categories(categories)}) for chunk in chunks]
+    return pd.concat(chunks, ignore_index=True)
+
+
+# -----------------------------------------------------------------------------
+# REPRESENTACIÓN COMPACTA
+# -----------------------------------------------------------------------------
+CATEGORY_COLUMNS = ['WELLBOAT', 'RESULTADO', 'TIPO MUESTREO', 'ARMADOR']
+SMALL_INT_COLUMNS = {'AÑO': 'Int16', 'MES': 'Int8', 'DIA': 'Int8'}
+
+
+def _as_text(series):
+    # Convertir a texto sin transformar los nulos en 'nan'
+    return series.where(series.isna(), series.astype(str))
+
+
+def compact_frame(df):
+    # Columnas de baja cardinalidad como códigos categóricos
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = _as_text(df[col]).astype('category')
+
+    # Año/mes/día como enteros pequeños (nullable: las fechas inválidas quedan NA)
+    for col, dtype in SMALL_INT_COLUMNS.items():
+        if col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+            except (TypeError, ValueError):
+                pass
+
+    # FOLIO es único por muestra: texto en un buffer Arrow contiguo en vez de
+    # un objeto Python por fila
+    if 'FOLIO' in df.columns:
+        df['FOLIO'] = _as_text(df['FOLIO']).astype(pd.StringDtype('pyarrow'))
+
+    return df
+
+
+def frame_memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
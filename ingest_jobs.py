@@ -0,0 +1,199 @@
+import io
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from ingest import REQUIRED_COLUMNS, compact_frame, concat_chunks, iter_csv_chunks
+from parallel_ingest import parse_source, reconcile_frames
+from snapshot_cache import read_snapshot, write_snapshot, write_snapshot_chunks
+
+# -----------------------------------------------------------------------------
+# INGESTA EN SEGUNDO PLANO
+# -----------------------------------------------------------------------------
+# La lectura de un archivo nuevo corre en un hilo (y los libros Excel en el
+# pool de procesos) mientras la sesión sigue respondiendo. Hay un solo trabajo
+# por contenido en todo el servidor: los reruns y otras sesiones que suben el
+# mismo archivo se enganchan al trabajo en curso en vez de repetirlo
+JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED = 'corriendo', 'listo', 'error', 'cancelado'
+
+# Cada cuánto revisa el hilo si se pidió cancelar mientras espera a un worker
+POLL_SECONDS = 0.2
+
+# Trabajos terminados que se conservan (resultado sin snapshot o error)
+MAX_FINISHED_JOBS = 4
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestJob:
+
+    def __init__(self, key, tasks, pool=None, on_finish=None):
+        # tasks: [(nombre, bytes, hoja)] como en load_sources
+        self.key = key
+        self.tasks = tasks
+        self.pool = pool
+        self.on_finish = on_finish
+        self.state = JOB_RUNNING
+        self.stage = 'En cola'
+        self.rows = 0
+        self.fraction = 0.0
+        # KPIs parciales (total, wellboats, positivos, negativos) al leer un CSV
+        self.kpis = None
+        self.result = None
+        self.saved = False
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ingesta-{key[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        # El hilo se detiene en el próximo bloque o al terminar el worker actual
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def _csv_chunks(self, data):
+        # Bloques compactos con progreso y KPIs parciales; al cancelar se corta
+        # con una excepción para que el snapshot a medio escribir se descarte
+        buffer = io.BytesIO(data)
+        wellboats = set()
+        positivos = negativos = 0
+        for chunk in iter_csv_chunks(buffer):
+            if self.cancelled:
+                raise IngestCancelled()
+            self.rows += len(chunk)
+            if 'RESULTADO' in chunk.columns:
+                positivos += int((chunk['RESULTADO'] == 'POSITIVO').sum())
+                negativos += int((chunk['RESULTADO'] == 'NEGATIVO').sum())
+            if 'WELLBOAT' in chunk.columns:
+                wellboats.update(chunk['WELLBOAT'].unique())
+            self.kpis = (self.rows, len(wellboats), positivos, negativos)
+            self.fraction = min(buffer.tell() / max(len(data), 1), 1.0)
+            yield compact_frame(chunk)
+
+    def _read_csv(self, data):
+        # Con la estructura esperada los bloques van directo al snapshot (uno a
+        # la vez en memoria); si no, se unen para que la sesión muestre los avisos
+        chunks = self._csv_chunks(data)
+        first = next(chunks, None)
+        if first is None or first.empty or not all(col in first.columns for col in REQUIRED_COLUMNS):
+            return concat_chunks(([] if first is None else [first]) + list(chunks))
+        write_snapshot_chunks(self.key, itertools.chain([first], chunks))
+        self.saved = True
+        return read_snapshot(self.key)
+
+    def _read_sources(self):
+        # Una fuente por worker; sin pool se leen en este mismo hilo
+        if self.pool is None:
+            futures = None
+        else:
+            futures = [self.pool.submit(parse_source, *task) for task in self.tasks]
+        frames = []
+        for i, task in enumerate(self.tasks):
+            self.stage = f"Leyendo {task[0]}" + (f" [{task[2]}]" if task[2] is not None else '')
+            if futures is None:
+                frame = parse_source(*task)
+            else:
+                while True:
+                    try:
+                        frame = futures[i].result(timeout=POLL_SECONDS)
+                        break
+                    except FutureTimeout:
+                        if self.cancelled:
+                            for future in futures:
+                                future.cancel()
+                            return None
+            if self.cancelled:
+                return None
+            frames.append(frame)
+            self.rows += len(frame)
+            self.fraction = (i + 1) / len(self.tasks)
+        return reconcile_frames(frames)
+
+    def _run(self):
+        try:
+            if len(self.tasks) == 1 and self.tasks[0][0].lower().endswith('.csv'):
+                self.stage = f"Leyendo {self.tasks[0][0]}"
+                df = self._read_csv(self.tasks[0][1])
+            else:
+                df = self._read_sources()
+                if df is None:
+                    raise IngestCancelled()
+                self.stage = 'Compactando'
+                df = compact_frame(df)
+                # Sólo los datos con la estructura esperada quedan como snapshot;
+                # el resto se entrega tal cual para que la sesión muestre los avisos
+                if not df.empty and all(col in df.columns for col in REQUIRED_COLUMNS):
+                    self.stage = 'Guardando snapshot'
+                    write_snapshot(self.key, df)
+                    df = read_snapshot(self.key)
+                    self.saved = True
+            if self.cancelled:
+                raise IngestCancelled()
+            self.result = df
+            self.stage = 'Terminado'
+            self.state = JOB_DONE
+        except IngestCancelled:
+            self.state = JOB_CANCELLED
+        except Exception as e:
+            self.error = f"{e}\n{traceback.format_exc()}"
+            self.state = JOB_FAILED
+        finally:
+            self.finished = time.time()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+
+class IngestJobs:
+    # Registro de trabajos por clave de dataset, compartido por las sesiones
+
+    def __init__(self, max_finished=MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def start(self, key, tasks, pool=None):
+        # Idempotente: si ya hay un trabajo para este contenido se devuelve ese
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = IngestJob(key, tasks, pool, self._finish).start()
+            return job
+
+    def discard(self, key):
+        with self._lock:
+            job = self._jobs.pop(key, None)
+        if job is not None and job.state == JOB_RUNNING:
+            job.cancel()
+
+    def _finish(self, job):
+        # Con snapshot guardado la sesión lo lee de disco: el trabajo sobra.
+        # Se conservan los últimos terminados sin snapshot (avisos o errores)
+        with self._lock:
+            if self._jobs.get(job.key) is not job:
+                return
+            if job.state == JOB_CANCELLED or job.saved:
+                del self._jobs[job.key]
+                return
+            finished = [key for key, other in self._jobs.items() if other.state != JOB_RUNNING]
+            for key in finished[:-self.max_finished]:
+                del self._jobs[key]
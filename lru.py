@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+# -----------------------------------------------------------------------------
+# CACHÉ LRU ACOTADA
+# -----------------------------------------------------------------------------
+
+
+class LRUCache:
+    # Compartida entre sesiones: protegida con un lock. El cálculo de un valor
+    # faltante se hace fuera del lock para no bloquear a las demás sesiones.
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,62 @@
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from excel_reader import read_excel_source
+from ingest import canonical_columns, compact_frame, concat_chunks, iter_csv_chunks, normalize_frame
+from snapshot_cache import content_hash
+
+# -----------------------------------------------------------------------------
+# INGESTA PARALELA DE VARIOS ARCHIVOS Y HOJAS
+# -----------------------------------------------------------------------------
+# Cada archivo u hoja se parsea y normaliza en un proceso aparte (openpyxl y
+# xlrd son Python puro y no liberan el GIL) y luego se unen con columnas
+# reconciliadas
+INGEST_WORKERS = int(os.environ.get('MUESTREO_INGEST_WORKERS', os.cpu_count() or 1))
+
+
+def create_pool(max_workers=INGEST_WORKERS):
+    # spawn: los workers no heredan los hilos del servidor de Streamlit
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def sources_key(parts):
+    # parts: [(hash del archivo, hoja)]; un archivo con su primera hoja
+    # conserva la clave de siempre (hash del contenido)
+    if len(parts) == 1 and parts[0][1] is None:
+        return parts[0][0]
+    return content_hash(json.dumps(parts, ensure_ascii=False).encode('utf-8'))
+
+
+def parse_source(name, data, sheet=None):
+    # Se ejecuta en un worker: recibe los bytes y devuelve el DataFrame
+    # normalizado y compacto (también es menos lo que vuelve por el pipe)
+    if not name.lower().endswith('.csv'):
+        return read_excel_source(name, data, sheet)
+    raw = pd.read_csv(io.BytesIO(data))
+    raw.columns = canonical_columns(raw.columns)
+    return compact_frame(normalize_frame(raw))
+
+
+def reconcile_frames(frames):
+    # Unión de columnas en orden de aparición; lo que falta en una fuente queda vacío
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    return concat_chunks(frame.reindex(columns=columns) for frame in frames)
+
+
+def load_sources(sources, pool=None):
+    # sources: [(nombre, bytes, hoja)]. Un CSV solo se lee por bloques, sin pool
+    if len(sources) == 1 and sources[0][0].lower().endswith('.csv'):
+        return concat_chunks(compact_frame(chunk) for chunk in iter_csv_chunks(io.BytesIO(sources[0][1])))
+    if pool is None or len(sources) == 1:
+        frames = [parse_source(*source) for source in sources]
+    else:
+        frames = list(pool.map(parse_source, *zip(*sources)))
+    return reconcile_frames(frames)
@@ -0,0 +1,185 @@
+import argparse
+import json
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+from cube import build_cube
+from excel_reader import workbook_sheets
+from geo import LAT_COLUMN, LON_COLUMN, SpatialIndex, coordinates
+from ingest import REQUIRED_COLUMNS, compact_frame
+from parallel_ingest import create_pool, load_sources, sources_key
+from snapshot_cache import (SNAPSHOT_DIR, SNAPSHOT_VERSION, content_hash, read_snapshot, snapshot_path, write_json,
+                            write_snapshot)
+
+# -----------------------------------------------------------------------------
+# PRECÁLCULO DEL DASHBOARD FUERA DE STREAMLIT
+# -----------------------------------------------------------------------------
+# Uso (ej. tarea nocturna):
+#   python precompute.py BDPROGRAMA_2016-2025.xlsx
+#   python precompute.py extracto1.xlsx extracto2.csv --hojas todas
+#
+# Escribe la tabla normalizada, el cubo de conteos y las estadísticas de los
+# filtros con la misma clave que usaría el dashboard al subir esos archivos, y
+# los publica en un manifiesto: al abrir la página sin archivos se cargan
+# directamente, y una subida del mismo contenido también los reutiliza
+PRECOMPUTED_PREFIX = 'precalculado'
+
+
+def manifest_path():
+    return SNAPSHOT_DIR / f"{PRECOMPUTED_PREFIX}-v{SNAPSHOT_VERSION}.json"
+
+
+def stats_path(key):
+    return SNAPSHOT_DIR / f"{key}-estadisticas-v{SNAPSHOT_VERSION}.json"
+
+
+def cube_key(key):
+    return f"{key}-cubo"
+
+
+def dataset_stats(df, extent=None):
+    # Opciones de filtros y estadísticas globales del panel lateral
+    stats = {'total': len(df), 'options': {}}
+    for col in ['WELLBOAT', 'RESULTADO', 'TIPO MUESTREO']:
+        if col in df.columns:
+            stats['options'][col] = sorted(df[col].dropna().unique().tolist())
+    if 'AÑO' in df.columns:
+        stats['options']['AÑO'] = sorted(df['AÑO'].dropna().unique().astype(int).tolist())
+    if 'FECHA MUESTREO' in df.columns and df['FECHA MUESTREO'].notna().any():
+        stats['fecha_min'] = df['FECHA MUESTREO'].min().date()
+        stats['fecha_max'] = df['FECHA MUESTREO'].max().date()
+    if 'WELLBOAT' in df.columns:
+        stats['wellboats'] = df['WELLBOAT'].nunique()
+    if 'RESULTADO' in df.columns:
+        stats['positivos'] = int((df['RESULTADO'] == 'POSITIVO').sum())
+    if LAT_COLUMN in df.columns and LON_COLUMN in df.columns:
+        stats['extent'] = SpatialIndex(*coordinates(df)).extent if extent is None else extent
+    return stats
+
+
+def write_stats(key, stats):
+    data = dict(stats)
+    for name in ['fecha_min', 'fecha_max']:
+        if name in data:
+            data[name] = data[name].isoformat()
+    if data.get('extent') is not None:
+        data['extent'] = [float(v) for v in data['extent']]
+    data['wellboats'] = int(data.get('wellboats', 0))
+    write_json(stats_path(key), data)
+
+
+def read_stats(key):
+    path = stats_path(key)
+    if not path.exists():
+        return None
+    stats = json.loads(path.read_text(encoding='utf-8'))
+    for name in ['fecha_min', 'fecha_max']:
+        if name in stats:
+            stats[name] = date.fromisoformat(stats[name])
+    if stats.get('extent') is not None:
+        stats['extent'] = tuple(stats['extent'])
+    return stats
+
+
+def read_cube(key):
+    # El mes (Period) no se guarda: se recalcula desde el día
+    cube = read_snapshot(cube_key(key))
+    if cube is not None and 'FECHA' in cube.columns:
+        cube['MES'] = cube['FECHA'].dt.to_period('M')
+    return cube
+
+
+def read_published():
+    path = manifest_path()
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def dataset_files(key):
+    return [snapshot_path(key), snapshot_path(cube_key(key)), stats_path(key)]
+
+
+def file_tasks(paths, sheets=None):
+    # (ruta, hojas) -> tareas (nombre, bytes, hoja) y claves (hash, hoja) con
+    # la misma convención del panel de carga: hoja None = primera hoja o CSV
+    tasks, keys = [], []
+    for path in paths:
+        path = Path(path)
+        data = path.read_bytes()
+        file_sheets = [None]
+        if path.suffix.lower() != '.csv' and sheets:
+            sheet_names = workbook_sheets(path.name, data)
+            missing = [sheet for sheet in sheets if sheet not in sheet_names] if sheets != ['todas'] else []
+            if missing:
+                raise ValueError(f"{path.name} no tiene las hojas {', '.join(missing)} "
+                                 f"(disponibles: {', '.join(sheet_names)})")
+            selected = sheet_names if sheets == ['todas'] else sheets
+            file_sheets = [None if sheet == sheet_names[0] else sheet for sheet in selected]
+        for sheet in file_sheets:
+            tasks.append((path.name, data, sheet))
+            keys.append((content_hash(data), sheet))
+    return tasks, keys
+
+
+def precompute(paths, sheets=None, publish=True, log=print):
+    tasks, keys = file_tasks(paths, sheets)
+    dataset_key = sources_key(keys)
+
+    started = time.perf_counter()
+    pool = create_pool() if len(tasks) > 1 else None
+    try:
+        df = load_sources(tasks, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if df.empty or missing:
+        raise ValueError(f"Datos sin la estructura esperada (faltan columnas: {missing})")
+    df = compact_frame(df)
+    log(f"Lectura y normalización: {len(df)} filas en {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    write_snapshot(dataset_key, df)
+    write_snapshot(cube_key(dataset_key), build_cube(df).drop(columns='MES', errors='ignore'))
+    write_stats(dataset_key, dataset_stats(df))
+    log(f"Snapshot, cubo y estadísticas: {time.perf_counter() - started:.1f} s")
+
+    if publish:
+        previous = read_published()
+        write_json(manifest_path(), {
+            'dataset_key': dataset_key,
+            'version': SNAPSHOT_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'sources': [name if sheet is None else f"{name} [{sheet}]" for name, _, sheet in tasks],
+            'rows': len(df),
+        })
+        # El dataset publicado antes ya no se sirve
+        if previous and previous['dataset_key'] != dataset_key:
+            for path in dataset_files(previous['dataset_key']):
+                path.unlink(missing_ok=True)
+        log(f"Publicado: {manifest_path()}")
+    return dataset_key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precalcula el snapshot que el dashboard carga al iniciar")
+    parser.add_argument('archivos', nargs='+', help="Archivos Excel/CSV de origen")
+    parser.add_argument('--hojas', nargs='+',
+                        help="Hojas a leer de cada libro ('todas' para todas); por defecto la primera")
+    parser.add_argument('--sin-publicar', action='store_true',
+                        help="Sólo escribe el snapshot (una subida del mismo contenido lo reutiliza)")
+    args = parser.parse_args(argv)
+    try:
+        dataset_key = precompute(args.archivos, args.hojas, publish=not args.sin_publicar)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Clave del dataset: {dataset_key}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# -----------------------------------------------------------------------------
+# PERFILADO POR ETAPAS (OPCIONAL)
+# -----------------------------------------------------------------------------
+# Se activa con la variable de entorno MUESTREO_PROFILE=1 o con ?perfil=1 en la URL
+PROFILE_ENV = 'MUESTREO_PROFILE'
+PROFILE_QUERY_PARAM = 'perfil'
+PROFILE_LOG = Path(os.environ.get(
+    'MUESTREO_PROFILE_LOG',
+    Path(__file__).resolve().parent / '.profiling' / 'stages.jsonl'
+))
+
+
+def profiling_requested(query_params):
+    flags = ('1', 'true', 'si', 'sí')
+    return (os.environ.get(PROFILE_ENV, '').lower() in flags
+            or str(query_params.get(PROFILE_QUERY_PARAM, '')).lower() in flags)
+
+
+# tracemalloc es del proceso y lo comparten todas las sesiones: se cuenta
+# cuántas ejecuciones perfiladas están en curso y se detiene con la última
+# (sólo si lo inició este módulo). Con varias sesiones a la vez los picos por
+# etapa son aproximados, porque cualquiera de ellas reinicia el pico global
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _tracing_started = not tracemalloc.is_tracing()
+            if _tracing_started:
+                tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+
+
+class StageProfiler:
+    # Registra tiempo, pico de memoria y filas procesadas de cada etapa de una
+    # ejecución del script. Desactivado, stage() no hace nada.
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self._peaks = []
+        self._release = None
+        self._begin()
+
+    def _begin(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self._started = time.perf_counter()
+        if self.enabled:
+            _start_tracing()
+            # Si la ejecución se corta antes de finish() la referencia se
+            # libera al recolectar el perfilador
+            self._release = weakref.finalize(self, _stop_tracing)
+
+    @contextmanager
+    def stage(self, name, rows=None, **details):
+        if not self.enabled:
+            yield {}
+            return
+
+        # El pico de tracemalloc es global: se reinicia por etapa y al salir
+        # se propaga a la etapa contenedora
+        start_memory, previous_peak = tracemalloc.get_traced_memory()
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], previous_peak)
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+
+        info = {'rows': rows, **details}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            rows = info.pop('rows', None)
+            self.records.append({
+                'run_id': self.run_id,
+                'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+                'stage': name,
+                'seconds': round(seconds, 6),
+                'peak_mb': round(max(peak - start_memory, 0) / 1024 ** 2, 3),
+                'rows': rows,
+                'details': info,
+            })
+
+    @contextmanager
+    def fragment_run(self, name, rerun):
+        # Una re-ejecución sólo del fragmento (rerun=True) no llega al final
+        # del script: sus etapas se cierran y se escriben al terminar
+        if not self.enabled or not rerun:
+            yield
+            return
+        self.records = []
+        self._begin()
+        try:
+            yield
+        finally:
+            if self.records:
+                self.finish(f"fragmento_{name}")
+                self.write_log()
+            else:
+                self._release()
+
+    def finish(self, stage='script_total'):
+        # Registro con el tiempo total del script (o del fragmento)
+        if not self.enabled:
+            return
+        self.records.append({
+            'run_id': self.run_id,
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'stage': stage,
+            'seconds': round(time.perf_counter() - self._started, 6),
+            'peak_mb': max((record['peak_mb'] for record in self.records), default=0.0),
+            'rows': None,
+            'details': {},
+        })
+        self._release()
+
+    def write_log(self, path=PROFILE_LOG):
+        if not self.enabled or not self.records:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as log:
+            for record in self.records:
+                log.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
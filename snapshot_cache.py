@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+
+# -----------------------------------------------------------------------------
+# SNAPSHOTS COLUMNARES EN DISCO
+# -----------------------------------------------------------------------------
+# Directorio compartido por todas las sesiones y procesos del servidor
+SNAPSHOT_DIR = Path(os.environ.get(
+    'MUESTREO_SNAPSHOT_DIR',
+    Path(__file__).resolve().parent / '.snapshots'
+))
+
+# Incrementar cuando cambie la normalización de load_data para invalidar
+# los snapshots generados con la versión anterior
+SNAPSHOT_VERSION = 5
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def snapshot_path(key):
+    return SNAPSHOT_DIR / f"{key}-v{SNAPSHOT_VERSION}.arrow"
+
+
+def arrow_safe(df):
+    # Excel suele mezclar números y textos en una misma columna (ej. LAT vacío
+    # como ''), lo que Arrow no acepta: esas columnas se guardan como texto.
+    # Sólo se copian las columnas reescritas
+    fixed = {}
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fixed[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df.assign(**fixed) if fixed else df
+
+
+def write_json(path, data):
+    # Escritura atómica de manifiestos y estadísticas, como los snapshots
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(data, tmp, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def unify_categories(chunk, categories):
+    # categories: columna -> valores vistos en los bloques anteriores. Los
+    # nuevos se agregan al final, así los códigos ya escritos siguen valiendo
+    updates = {}
+    for col in chunk.columns:
+        if not isinstance(chunk[col].dtype, pd.CategoricalDtype):
+            continue
+        values = chunk[col].cat.categories
+        known = categories.get(col)
+        known = values if known is None else known.append(values.difference(known, sort=False))
+        categories[col] = known
+        updates[col] = chunk[col].cat.set_categories(known)
+    return chunk.assign(**updates) if updates else chunk
+
+
+def _concat_unified(frames, categories):
+    # Todas las partes con las categorías finales: concat conserva el tipo
+    frames = [frame.assign(**{col: frame[col].cat.set_categories(known)
+                              for col, known in categories.items()
+                              if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype)})
+              for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_snapshot(key):
+    path = snapshot_path(key)
+    if not path.exists():
+        return None
+    # Lectura con memory-map. Con split_blocks las columnas numéricas y de
+    # fecha sin nulos quedan como vistas (de sólo lectura) sobre el archivo
+    # mapeado, cuyas páginas se comparten entre procesos vía page cache; FOLIO
+    # sigue respaldado por Arrow. Los códigos de las categorías y los enteros
+    # con nulos sí se copian a memoria propia del proceso
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_snapshot_rows(key, rows):
+    # Sólo las filas pedidas: el resto del archivo mapeado no se convierte
+    path = snapshot_path(key)
+    if not path.exists():
+        return None
+    table = feather.read_table(path, memory_map=True)
+    return table.take(pa.array(rows, type=pa.int64())).to_pandas()
+
+
+def write_snapshot(key, df):
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(arrow_safe(df), preserve_index=False)
+
+    # Escritura atómica: otro worker nunca ve un snapshot a medio escribir
+    fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        # Sin compresión para que la lectura pueda mapearse directamente
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, snapshot_path(key))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return snapshot_path(key)
+
+
+def _stable_schema(schema):
+    # Índices de diccionario de 32 bits: un bloque con más categorías no
+    # cambia el tipo de la columna
+    return pa.schema([
+        pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type), field.nullable)
+        if pa.types.is_dictionary(field.type) else field
+        for field in schema
+    ], metadata=schema.metadata)
+
+
+def write_snapshot_chunks(key, chunks):
+    # Snapshot escrito bloque a bloque en el mismo formato (IPC de Arrow) que
+    # write_snapshot: sólo hay un bloque compacto en memoria a la vez y las
+    # categorías nuevas se escriben como deltas del diccionario. Si un bloque
+    # trae tipos que no calzan con los anteriores (ej. textos en una columna
+    # numérica) se termina en memoria. None si no hubo bloques
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix='.tmp')
+    os.close(fd)
+    chunks = iter(chunks)
+    categories, schema, writer = {}, None, None
+    try:
+        for chunk in chunks:
+            chunk = unify_categories(chunk, categories)
+            table = pa.Table.from_pandas(arrow_safe(chunk), preserve_index=False)
+            if writer is None:
+                schema = _stable_schema(table.schema)
+                writer = ipc.new_file(tmp_path, schema,
+                                      options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            try:
+                table = table.cast(schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, ValueError):
+                writer.close()
+                writer = None
+                written = feather.read_table(tmp_path).to_pandas()
+                rest = [chunk] + [unify_categories(part, categories) for part in chunks]
+                return write_snapshot(key, _concat_unified([written] + rest, categories))
+            writer.write_table(table)
+        if writer is None:
+            return None
+        writer.close()
+        writer = None
+        os.replace(tmp_path, snapshot_path(key))
+        return snapshot_path(key)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,281 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, DATE_COLUMN
+from filter_index import FILTER_COLUMNS
+from geo import LAT_COLUMN, LON_COLUMN, grouped_bins
+from folio_index import FOLIO_MAX_RESULTS, SENTINEL, normalize_folio
+
+# -----------------------------------------------------------------------------
+# BACKEND SQL EN DISCO (OPCIONAL)
+# -----------------------------------------------------------------------------
+# Con MUESTREO_BACKEND=sqlite los datos se guardan en una base SQLite por
+# dataset y los filtros, KPIs, agregados y páginas de la tabla se resuelven con
+# consultas: a Python sólo vuelven resultados pequeños
+BACKEND_ENV = 'MUESTREO_BACKEND'
+SQL_DIR = Path(os.environ.get(
+    'MUESTREO_SQL_DIR',
+    Path(__file__).resolve().parent / '.sqlite'
+))
+
+# Incrementar cuando cambie el esquema de las tablas
+SQL_VERSION = 4
+
+TABLE = 'muestreos'
+# Día (desde 1970-01-01) de cada muestra, para agregar el cubo sin convertir fechas
+DAY_COLUMN = '_DIA'
+INDEXED_COLUMNS = [DATE_COLUMN, 'FOLIO', LAT_COLUMN] + FILTER_COLUMNS
+SQL_CHUNK_ROWS = 50_000
+
+MICROS_PER_DAY = 86_400 * 1_000_000
+
+
+def sql_backend_requested():
+    return os.environ.get(BACKEND_ENV, '').lower() in ('sqlite', 'sql')
+
+
+def sql_path(key):
+    return SQL_DIR / f"{key}-v{SQL_VERSION}.sqlite"
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _to_micros(value):
+    return pd.Timestamp(value).value // 1000
+
+
+def _sql_frame(chunk):
+    # Fechas como enteros (microsegundos), categorías como texto y enteros
+    # nullable como objetos con None, que es lo que entiende sqlite3
+    chunk = chunk.copy()
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            micros = series.dt.as_unit('us').to_numpy().view('int64')
+            chunk[col] = pd.Series(micros, index=chunk.index, dtype='Int64').where(series.notna())
+        if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+            chunk[col] = chunk[col].astype(object)
+        if isinstance(chunk[col].dtype, pd.api.extensions.ExtensionDtype):
+            chunk[col] = chunk[col].astype(object).where(chunk[col].notna(), None)
+    # Coordenadas siempre numéricas (vacíos como NULL) para filtrar por rango
+    for col in [LAT_COLUMN, LON_COLUMN]:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+    if 'FOLIO' in chunk.columns:
+        folio = chunk['FOLIO']
+        chunk['FOLIO'] = folio.where(folio.isna(), folio.astype(str).str.strip().str.upper())
+    if DATE_COLUMN in chunk.columns:
+        chunk[DAY_COLUMN] = (chunk[DATE_COLUMN].astype('Float64') // MICROS_PER_DAY).astype('Int64')
+        chunk[DAY_COLUMN] = chunk[DAY_COLUMN].astype(object).where(chunk[DAY_COLUMN].notna(), None)
+    return chunk
+
+
+def build_database(key, chunks):
+    # Escritura atómica en un archivo temporal, como los snapshots: otro
+    # worker nunca abre una base a medio construir
+    SQL_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=SQL_DIR, suffix='.tmp')
+    os.close(fd)
+    rows = 0
+    try:
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.execute('PRAGMA synchronous=OFF')
+            for chunk in chunks:
+                _sql_frame(chunk).to_sql(TABLE, conn, if_exists='append', index=False,
+                                         chunksize=SQL_CHUNK_ROWS)
+                rows += len(chunk)
+            columns = _table_columns(conn)
+            for col in INDEXED_COLUMNS + [DAY_COLUMN]:
+                if col in columns:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {quote('idx_' + col)} "
+                                 f"ON {TABLE} ({quote(col)})")
+            conn.execute('ANALYZE')
+            conn.commit()
+        os.replace(tmp_path, sql_path(key))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def _table_columns(conn):
+    return {row[1]: (row[2] or '').upper() for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+
+
+class SQLBackend:
+    # Consultas de sólo lectura sobre la base de un dataset. Cada consulta abre
+    # su propia conexión, así una instancia se comparte entre sesiones e hilos
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with closing(self._connect()) as conn:
+            self._types = _table_columns(conn)
+        self.columns = [col for col in self._types if col != DAY_COLUMN]
+        self.dimensions = [col for col in CUBE_DIMENSIONS if col in self.columns]
+        # Columnas del cubo que devuelve cube(), sin necesidad de consultarlo
+        has_date = DATE_COLUMN in self.columns
+        self.cube_columns = tuple((['FECHA'] if has_date else []) + self.dimensions
+                                  + ['Cantidad'] + (['MES'] if has_date else []))
+
+    def _connect(self):
+        return sqlite3.connect(f"{self.path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+
+    def _query(self, sql, params=()):
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def _scalar(self, sql, params=()):
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def _from_sql(self, frame):
+        # Tipos de vuelta según la afinidad declarada de cada columna
+        for col in frame.columns:
+            if col == DATE_COLUMN:
+                frame[col] = pd.to_datetime(pd.to_numeric(frame[col], errors='coerce'), unit='us')
+            elif self._types.get(col) == 'INTEGER':
+                frame[col] = pd.to_numeric(frame[col], errors='coerce').astype('Int64')
+            elif self._types.get(col) == 'REAL':
+                frame[col] = pd.to_numeric(frame[col], errors='coerce').astype('float64')
+            elif self._types.get(col) == 'TEXT':
+                frame[col] = frame[col].astype(pd.StringDtype())
+        return frame
+
+    def where(self, criteria, fecha_inicio=None, fecha_fin=None, search=None, bbox=None):
+        # Filtros del sidebar como predicados SQL con parámetros
+        clauses, params = [], []
+        if bbox is not None:
+            lat_min, lat_max, lon_min, lon_max = bbox
+            clauses.append(f"{quote(LAT_COLUMN)} BETWEEN ? AND ? AND {quote(LON_COLUMN)} BETWEEN ? AND ?")
+            params.extend([lat_min, lat_max, lon_min, lon_max])
+        for col, value in criteria.items():
+            clauses.append(f"{quote(col)} = ?")
+            params.append(value)
+        if DATE_COLUMN in self.columns:
+            clauses.append(f"{quote(DATE_COLUMN)} IS NOT NULL")
+            if fecha_inicio is not None:
+                clauses.append(f"{quote(DATE_COLUMN)} >= ?")
+                params.append(_to_micros(fecha_inicio))
+            if fecha_fin is not None:
+                clauses.append(f"{quote(DATE_COLUMN)} <= ?")
+                params.append(_to_micros(fecha_fin))
+        if search is not None and search[1].strip():
+            column, text = search
+            escaped = text.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            target = quote(column)
+            if column == DATE_COLUMN:
+                target = f"strftime('%Y-%m-%d %H:%M:%S', {target} / 1000000, 'unixepoch')"
+            clauses.append(f"CAST({target} AS TEXT) LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def count(self, criteria, fecha_inicio=None, fecha_fin=None, search=None, bbox=None):
+        where, params = self.where(criteria, fecha_inicio, fecha_fin, search, bbox)
+        return int(self._scalar(f"SELECT COUNT(*) FROM {TABLE}{where}", params))
+
+    def stats(self):
+        # Mismas claves que get_dataset_stats del modo en memoria
+        stats = {'total': int(self._scalar(f"SELECT COUNT(*) FROM {TABLE}")), 'options': {}}
+        for col in FILTER_COLUMNS:
+            if col in self.columns:
+                values = self._query(f"SELECT DISTINCT {quote(col)} AS v FROM {TABLE} "
+                                     f"WHERE {quote(col)} IS NOT NULL ORDER BY v")['v']
+                stats['options'][col] = [int(v) for v in values] if col == 'AÑO' else values.tolist()
+        if DATE_COLUMN in self.columns:
+            fecha_min, fecha_max = self._query(
+                f"SELECT MIN({quote(DATE_COLUMN)}) AS a, MAX({quote(DATE_COLUMN)}) AS b FROM {TABLE}").iloc[0]
+            if pd.notna(fecha_min):
+                stats['fecha_min'] = pd.to_datetime(fecha_min, unit='us').date()
+                stats['fecha_max'] = pd.to_datetime(fecha_max, unit='us').date()
+        if 'WELLBOAT' in self.columns:
+            stats['wellboats'] = int(self._scalar(f"SELECT COUNT(DISTINCT WELLBOAT) FROM {TABLE}"))
+        if LAT_COLUMN in self.columns and LON_COLUMN in self.columns:
+            extent = self._query(
+                f"SELECT MIN({quote(LAT_COLUMN)}) AS a, MAX({quote(LAT_COLUMN)}) AS b, "
+                f"MIN({quote(LON_COLUMN)}) AS c, MAX({quote(LON_COLUMN)}) AS d FROM {TABLE} "
+                f"WHERE {quote(LAT_COLUMN)} IS NOT NULL AND {quote(LON_COLUMN)} IS NOT NULL").iloc[0]
+            if extent.notna().all():
+                stats['extent'] = tuple(float(v) for v in extent)
+        if 'RESULTADO' in self.columns:
+            stats['positivos'] = int(self._scalar(
+                f"SELECT COUNT(*) FROM {TABLE} WHERE RESULTADO = 'POSITIVO'"))
+        return stats
+
+    def cube(self, criteria, fecha_inicio=None, fecha_fin=None, bbox=None):
+        # Mismo formato que slice_cube(): una fila por día × dimensiones
+        where, params = self.where(criteria, fecha_inicio, fecha_fin, bbox=bbox)
+        keys = [quote(col) for col in self.dimensions]
+        if DATE_COLUMN in self.columns:
+            keys.insert(0, DAY_COLUMN)
+        if not keys:
+            return pd.DataFrame({'Cantidad': [self.count(criteria, bbox=bbox)]})
+
+        group = ', '.join(keys)
+        cube = self._query(f"SELECT {group}, COUNT(*) AS Cantidad FROM {TABLE}{where} "
+                           f"GROUP BY {group} ORDER BY {keys[0]}", params)
+        if DAY_COLUMN in cube.columns:
+            fecha = pd.to_datetime(cube.pop(DAY_COLUMN), unit='D')
+            cube.insert(0, 'FECHA', fecha)
+            cube['MES'] = cube['FECHA'].dt.to_period('M')
+        if 'AÑO' in cube.columns:
+            cube['AÑO'] = pd.to_numeric(cube['AÑO'], errors='coerce').astype('Int64')
+        cube['Cantidad'] = cube['Cantidad'].astype('int64')
+        return cube
+
+    def page(self, criteria, fecha_inicio, fecha_fin, sort_column, ascending=True,
+             search=None, offset=0, limit=100, bbox=None):
+        # Página ordenada; los nulos van al final como en pandas
+        where, params = self.where(criteria, fecha_inicio, fecha_fin, search, bbox)
+        direction = 'ASC' if ascending else 'DESC'
+        select = ', '.join(quote(col) for col in self.columns)
+        sql = (f"SELECT {select} FROM {TABLE}{where} "
+               f"ORDER BY {quote(sort_column)} IS NULL, {quote(sort_column)} {direction}, rowid "
+               f"LIMIT ? OFFSET ?")
+        return self._from_sql(self._query(sql, [*params, limit, offset]))
+
+    def map_bins(self, criteria, fecha_inicio=None, fecha_fin=None, bbox=None, step=1.0):
+        # Grilla del mapa agregada en la base: vuelve una fila por celda
+        where, params = self.where(criteria, fecha_inicio, fecha_fin, bbox=bbox)
+        valid = f"{quote(LAT_COLUMN)} IS NOT NULL AND {quote(LON_COLUMN)} IS NOT NULL"
+        where = f"{where} AND {valid}" if where else f" WHERE {valid}"
+        # CAST trunca hacia cero: se desplaza a positivos para que equivalga a floor
+        cells = self._query(
+            f"SELECT CAST(({quote(LAT_COLUMN)} + 90) / ? AS INTEGER) AS fila, "
+            f"CAST(({quote(LON_COLUMN)} + 180) / ? AS INTEGER) AS columna, "
+            f"COUNT(*) AS Muestras, SUM(RESULTADO = 'POSITIVO') AS Positivos "
+            f"FROM {TABLE}{where} GROUP BY fila, columna", [step, step, *params])
+        cells['fila'] -= round(90 / step)
+        cells['columna'] -= round(180 / step)
+        return grouped_bins(cells, step)
+
+    def lookup_folio(self, text, limit=FOLIO_MAX_RESULTS):
+        # Prefijo como rango sobre el índice de FOLIO (LIKE no usaría el índice);
+        # los FOLIO se guardan normalizados en build_database
+        key = normalize_folio(text)
+        if not key or 'FOLIO' not in self.columns:
+            return self.empty_frame(), 0
+        where, params = ' WHERE FOLIO >= ? AND FOLIO < ?', [key, key + SENTINEL]
+        total = int(self._scalar(f"SELECT COUNT(*) FROM {TABLE}{where}", params))
+        select = ', '.join(quote(col) for col in self.columns)
+        matches = self._query(f"SELECT {select} FROM {TABLE}{where} ORDER BY FOLIO LIMIT ?", [*params, limit])
+        return self._from_sql(matches), total
+
+    def empty_frame(self):
+        return self._from_sql(pd.DataFrame({col: pd.Series(dtype=object) for col in self.columns}))
+
+    def iter_rows(self, criteria, fecha_inicio=None, fecha_fin=None, bbox=None, chunk_rows=SQL_CHUNK_ROWS):
+        # Filas filtradas por bloques, para exportar sin materializar el resultado
+        where, params = self.where(criteria, fecha_inicio, fecha_fin, bbox=bbox)
+        select = ', '.join(quote(col) for col in self.columns)
+        with closing(self._connect()) as conn:
+            for chunk in pd.read_sql_query(f"SELECT {select} FROM {TABLE}{where} ORDER BY rowid",
+                                           conn, params=params, chunksize=chunk_rows):
+                yield self._from_sql(chunk)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# GENERADOR DE DATOS SINTÉTICOS DE MUESTREO
+# -----------------------------------------------------------------------------
+# Tablas con el mismo esquema que BDPROGRAMA_2016-2025.xlsx, para medir el
+# pipeline con volúmenes controlados
+START_DATE = pd.Timestamp('2016-11-01')
+END_DATE = pd.Timestamp('2025-12-31')
+
+N_WELLBOATS = 60
+TIPOS_MUESTREO = ['RECALADA', 'ZARPE', 'CAMBIO DE AGUA', 'RUTINA']
+TIPOS_PESOS = [0.45, 0.35, 0.1, 0.1]
+POSITIVITY_RATE = 0.08
+
+# Variantes "sucias" que aparecen en los archivos reales y que la
+# normalización debe limpiar
+RESULTADO_VARIANTES = {
+    'NEGATIVO': ['NEGATIVO', 'negativo', 'Negativo ', ' NEGATIVO'],
+    'POSITIVO': ['POSITIVO', 'positivo', 'Positivo '],
+}
+
+# Zonas de operación (lat, lon) aproximadas de los centros de cultivo
+ZONAS = np.array([
+    (-41.5, -72.9), (-42.1, -73.4), (-42.6, -73.7), (-43.1, -73.6),
+    (-44.3, -73.2), (-45.4, -73.8), (-46.5, -75.1), (-51.7, -72.5),
+])
+
+
+def generate_samples(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Fechas con estacionalidad suave (más muestreo en otoño-invierno)
+    n_days = (END_DATE - START_DATE).days + 1
+    days = np.arange(n_days)
+    weights = 1 + 0.4 * np.sin(2 * np.pi * (days - 60) / 365.25)
+    fechas = START_DATE + pd.to_timedelta(
+        np.sort(rng.choice(days, size=n_rows, p=weights / weights.sum())), unit='D')
+
+    # FOLIO correlativo por año: QLL-FAN-2016-1000, QLL-FAN-2016-1001, ...
+    años = fechas.year.to_numpy()
+    seq = pd.Series(np.ones(n_rows, dtype=np.int64)).groupby(años).cumsum().to_numpy() + 999
+    folio = 'QLL-FAN-' + pd.Series(años).astype(str) + '-' + pd.Series(seq).astype(str)
+
+    # Wellboats con frecuencia tipo Zipf y un armador fijo por nave
+    wellboats = np.array([f"WELLBOAT {i:02d}" for i in range(1, N_WELLBOATS + 1)], dtype=object)
+    wellboats[:4] = ['ORCA CHONO', 'RIO DULCE 1', 'PATAGON V', 'AYSEN I']
+    zipf = 1 / np.arange(1, N_WELLBOATS + 1)
+    wb_idx = rng.choice(N_WELLBOATS, size=n_rows, p=zipf / zipf.sum())
+    armadores = np.array([f"ARMADOR {i % 12 + 1}" for i in range(N_WELLBOATS)], dtype=object)
+
+    wellboat = pd.Series(wellboats[wb_idx])
+    wellboat[rng.random(n_rows) < 0.01] = None
+    armador = pd.Series(armadores[wb_idx])
+    armador[rng.random(n_rows) < 0.2] = ''
+
+    # Resultado con positividad variable por nave
+    nave_rate = np.clip(rng.normal(POSITIVITY_RATE, 0.04, N_WELLBOATS), 0.005, 0.4)
+    positivo = rng.random(n_rows) < nave_rate[wb_idx]
+    resultado = np.where(positivo, 'POSITIVO', 'NEGATIVO').astype(object)
+    for valor, variantes in RESULTADO_VARIANTES.items():
+        mask = resultado == valor
+        resultado[mask] = rng.choice(variantes, size=int(mask.sum()), p=[0.85] + [0.15 / (len(variantes) - 1)] * (len(variantes) - 1))
+
+    # Coordenadas alrededor de la zona habitual de cada nave, con vacíos
+    zona = ZONAS[wb_idx % len(ZONAS)]
+    lat = np.round(zona[:, 0] + rng.normal(0, 0.25, n_rows), 5)
+    lon = np.round(zona[:, 1] + rng.normal(0, 0.25, n_rows), 5)
+    sin_coordenadas = rng.random(n_rows) < 0.1
+    lat[sin_coordenadas] = np.nan
+    lon[sin_coordenadas] = np.nan
+
+    return pd.DataFrame({
+        'FOLIO': folio,
+        'FECHA MUESTREO': fechas,
+        'WELLBOAT': wellboat,
+        'ARMADOR': armador,
+        'MUESTREADOR': '',
+        'ANALISTA': '',
+        'LAT': lat,
+        'LON': lon,
+        'RESULTADO': resultado,
+        'TIPO MUESTREO': rng.choice(TIPOS_MUESTREO, size=n_rows, p=TIPOS_PESOS),
+        'DIA': fechas.day,
+        'MES': fechas.month,
+        'AÑO': fechas.year,
+    })
+
+
+def write_samples(df, path):
+    path = str(path)
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    elif path.endswith('.xlsx'):
+        df.to_excel(path, index=False, engine='openpyxl')
+    else:
+        raise ValueError(f"Formato no soportado: {path}")
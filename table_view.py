@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# TABLA PAGINADA SOBRE IDS DE FILA
+# -----------------------------------------------------------------------------
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+class SortOrder:
+    # Orden global de una columna, calculado una vez por dataset. Para ordenar
+    # un subconjunto de filas basta con comparar rangos enteros.
+
+    def __init__(self, series):
+        values = series.reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype) and not values.cat.ordered:
+            # Un categórico se ordena por código: al unir bloques las categorías
+            # nuevas quedan al final, así que se reordenan por valor
+            values = values.cat.reorder_categories(values.cat.categories.sort_values())
+        self.order = np.asarray(values.sort_values(kind='stable', na_position='last').index)
+        self.rank = np.empty(len(self.order), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(self.order))
+
+    def sort(self, row_ids, ascending=True):
+        n_rows = len(self.order)
+        if len(row_ids) * np.log2(max(len(row_ids), 2)) > n_rows:
+            # Subconjunto grande: recorrer el orden global es lineal
+            member = np.zeros(n_rows, dtype=bool)
+            member[row_ids] = True
+            sorted_ids = self.order[member[self.order]]
+        else:
+            sorted_ids = row_ids[np.argsort(self.rank[row_ids], kind='stable')]
+        return sorted_ids if ascending else sorted_ids[::-1]
+
+
+def search_rows(df, row_ids, column, text):
+    # Búsqueda de texto (sin distinguir mayúsculas) dentro de una columna
+    text = text.strip()
+    if not text or len(row_ids) == 0:
+        return row_ids
+
+    series = df[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Se busca en las categorías y se compara por código
+        categories = series.cat.categories.astype(str)
+        matches = np.flatnonzero(categories.str.contains(text, case=False, regex=False))
+        codes = series.cat.codes.to_numpy()
+        return row_ids[np.isin(codes[row_ids], matches)]
+
+    values = series.take(row_ids).astype(str)
+    return row_ids[values.str.contains(text, case=False, regex=False).to_numpy()]
+
+
+def page_bounds(n_rows, page, page_size):
+    n_pages = max(1, -(-n_rows // page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, n_rows), n_pages
@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+import history_store
+import snapshot_cache
+from cube import build_cube
+from ingest import compact_frame, normalize_frame
+from synthetic_data import generate_samples
+
+
+# -----------------------------------------------------------------------------
+# FUSIÓN INCREMENTAL DEL HISTÓRICO
+# -----------------------------------------------------------------------------
+# El cubo y el índice FOLIO se mantienen por delta: después de cada fusión
+# deben coincidir con reconstruirlos desde las filas vigentes
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, 'SNAPSHOT_DIR', tmp_path)
+    monkeypatch.setattr(history_store, 'SNAPSHOT_DIR', tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope='module')
+def samples():
+    return compact_frame(normalize_frame(generate_samples(6000, seed=1)))
+
+
+def extract(samples, start, stop):
+    return compact_frame(samples.iloc[start:stop].reset_index(drop=True).copy())
+
+
+def comparable(cube):
+    # Mismas celdas sin importar el orden ni los tipos de las columnas
+    keys = [col for col in cube.columns if col != 'Cantidad']
+    cube = cube.assign(**{col: cube[col].astype(str) for col in keys})
+    cube = cube.groupby(keys, dropna=False)['Cantidad'].sum().reset_index()
+    return cube[cube['Cantidad'] > 0].sort_values(keys).reset_index(drop=True)
+
+
+def assert_consistent(manifest):
+    history = history_store.load_history(manifest)
+    assert history['FOLIO'].is_unique
+    assert manifest['rows'] == len(history)
+    pd.testing.assert_frame_equal(comparable(history_store.load_history_cube(manifest)),
+                                  comparable(build_cube(history)), check_dtype=False)
+    return history
+
+
+def test_insert_update_duplicate_and_conflict_counts(samples):
+    report, manifest = history_store.merge_into_history(extract(samples, 0, 1000), 'a')
+    assert report == {'insertados': 1000, 'actualizados': 0, 'duplicados': 0, 'conflictos': 0}
+
+    # 300 nuevos, 100 cambiados y 100 repetidos sin cambios
+    part = extract(samples, 800, 1300)
+    part['RESULTADO'] = part['RESULTADO'].astype(object)
+    part.loc[:99, 'RESULTADO'] = 'POSITIVO X'
+    report, manifest = history_store.merge_into_history(compact_frame(part), 'b')
+    assert report == {'insertados': 300, 'actualizados': 100, 'duplicados': 100, 'conflictos': 0}
+    history = assert_consistent(manifest)
+    assert (history['RESULTADO'] == 'POSITIVO X').sum() == 100
+
+    # Un FOLIO con dos contenidos distintos en el mismo extracto y uno vacío
+    part = extract(samples, 1300, 1310)
+    conflict = pd.concat([part, part.iloc[[0]].assign(WELLBOAT='OTRO')], ignore_index=True)
+    conflict['FOLIO'] = conflict['FOLIO'].astype(object)
+    conflict.loc[1, 'FOLIO'] = None
+    report, manifest = history_store.merge_into_history(compact_frame(conflict), 'c')
+    assert report == {'insertados': 8, 'actualizados': 0, 'duplicados': 0, 'conflictos': 3}
+    assert_consistent(manifest)
+
+    # El mismo archivo otra vez no se vuelve a fusionar
+    again, manifest = history_store.merge_into_history(extract(samples, 0, 1000), 'a')
+    assert again['insertados'] == 1000
+    assert manifest['rows'] == 1308
+
+
+def test_stale_generation_is_not_merged_twice(samples):
+    _, manifest = history_store.merge_into_history(extract(samples, 0, 1000), 'a')
+    generation, history = manifest['generation'], history_store.load_history(manifest)
+    first, _ = history_store.merge_into_history(extract(samples, 1000, 2000), 'b1', history, generation)
+    second, manifest = history_store.merge_into_history(extract(samples, 1000, 2000), 'b2', history, generation)
+    assert first['insertados'] == 1000
+    assert second == {'insertados': 0, 'actualizados': 0, 'duplicados': 1000, 'conflictos': 0}
+    assert_consistent(manifest)
+
+
+def test_many_merges_with_compaction_match_full_rebuild(samples):
+    manifest = None
+    for i in range(history_store.MAX_SEGMENTS + 4):
+        # Cada extracto trae filas nuevas y vuelve a traer las del anterior
+        part = extract(samples, max(i * 300 - 100, 0), (i + 1) * 300)
+        if i % 3 == 0:
+            part['TIPO MUESTREO'] = part['TIPO MUESTREO'].astype(object)
+            part.loc[:49, 'TIPO MUESTREO'] = f"TIPO {i}"
+            part = compact_frame(part)
+        _, manifest = history_store.merge_into_history(part, f"p{i}")
+        assert_consistent(manifest)
+    assert len(manifest['segments']) <= history_store.MAX_SEGMENTS
+    assert manifest['rows'] == (history_store.MAX_SEGMENTS + 4) * 300
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# SERIES TEMPORALES: RESOLUCIÓN ADAPTATIVA Y REDUCCIÓN DE PUNTOS
+# -----------------------------------------------------------------------------
+RESOLUTIONS = {
+    'Día': 'D',
+    'Semana': 'W-MON',
+    'Mes': 'MS',
+}
+
+# Límites de la resolución automática (en días del rango mostrado)
+AUTO_DAY_MAX_DAYS = 120
+AUTO_WEEK_MAX_DAYS = 3 * 365
+
+# Máximo de puntos enviados al navegador y umbral para usar WebGL
+MAX_POINTS = 1000
+WEBGL_MIN_POINTS = 500
+
+
+def auto_resolution(fecha_inicio, fecha_fin):
+    span_days = (pd.Timestamp(fecha_fin) - pd.Timestamp(fecha_inicio)).days
+    if span_days <= AUTO_DAY_MAX_DAYS:
+        return 'Día'
+    if span_days <= AUTO_WEEK_MAX_DAYS:
+        return 'Semana'
+    return 'Mes'
+
+
+def resample_counts(daily, resolution):
+    # daily: columnas FECHA (día) y Cantidad; los periodos sin muestras quedan en 0
+    freq = RESOLUTIONS[resolution]
+    series = daily.set_index('FECHA')['Cantidad'].resample(freq, label='left', closed='left').sum()
+    return series.rename_axis('FECHA').reset_index(name='Cantidad')
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: conserva la forma de la serie (picos y
+    # valles) eligiendo un punto por bucket
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Promedio del bucket siguiente como tercer vértice del triángulo
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample(series, max_points=MAX_POINTS):
+    if len(series) <= max_points:
+        return series
+    x = series['FECHA'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    keep = lttb(x, series['Cantidad'].to_numpy(), max_points)
+    return series.iloc[keep]
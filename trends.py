@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# POSITIVIDAD MÓVIL Y ALERTAS POR GRUPO
+# -----------------------------------------------------------------------------
+# Tasas de positivos en ventanas de N días para todos los grupos (wellboats o
+# tipos de muestreo) a la vez: sumas acumuladas sobre la serie diaria ordenada
+# por grupo y búsqueda binaria del inicio de cada ventana, sin recorrer grupos
+TREND_WINDOWS = [30, 90]
+
+# Umbral de alerta (% de positivos en la ventana) y mínimo de muestras para
+# que una tasa cuente (3 positivos de 4 muestras no es una tendencia)
+ALERT_THRESHOLD = 20.0
+MIN_WINDOW_SAMPLES = 10
+
+
+def daily_positivity(cube, group_col):
+    # Muestras y positivos por grupo y día a partir del cubo de conteos,
+    # ordenado por grupo y fecha
+    data = cube[cube[group_col].notna()]
+    positivos = data['Cantidad'].where((data['RESULTADO'] == 'POSITIVO').to_numpy(), 0)
+    daily = (data.assign(Positivos=positivos)
+             .groupby([group_col, 'FECHA'], observed=True, sort=True)[['Cantidad', 'Positivos']].sum()
+             .reset_index()
+             .rename(columns={'Cantidad': 'Muestras'}))
+    return daily[daily['Muestras'] > 0].reset_index(drop=True)
+
+
+def _rate(positivos, muestras):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(muestras > 0, positivos / muestras * 100, np.nan)
+
+
+def rolling_positivity(daily, group_col, window_days):
+    # Tasa móvil en cada día con muestras: la ventana es (día - N, día]
+    if daily.empty:
+        return daily.assign(Tasa=pd.Series(dtype=float))
+    codes = pd.factorize(daily[group_col], sort=False)[0].astype(np.int64)
+    days = daily['FECHA'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    days = days - days.min()
+    # Clave grupo × día creciente: una sola búsqueda binaria para todos los grupos
+    span = int(days.max()) + window_days + 1
+    key = codes * span + days
+    group_start = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])[codes]
+    start = np.maximum(np.searchsorted(key, key - window_days + 1, side='left'), group_start)
+
+    rolled = {}
+    for col in ['Muestras', 'Positivos']:
+        cum = np.concatenate([[0], np.cumsum(daily[col].to_numpy(np.int64))])
+        rolled[col] = cum[1:] - cum[start]
+    return pd.DataFrame({
+        group_col: daily[group_col].array,
+        'FECHA': daily['FECHA'].array,
+        'Muestras': rolled['Muestras'],
+        'Positivos': rolled['Positivos'],
+        'Tasa': _rate(rolled['Positivos'], rolled['Muestras']),
+    })
+
+
+def risk_table(daily, group_col, windows=TREND_WINDOWS, threshold=ALERT_THRESHOLD,
+               min_samples=MIN_WINDOW_SAMPLES):
+    # Situación de cada grupo al último día con datos: muestras y tasa en cada
+    # ventana. La alerta usa la primera ventana; el orden pone primero las alertas
+    if daily.empty:
+        return pd.DataFrame()
+    as_of = daily['FECHA'].max()
+    grouped = daily.groupby(group_col, observed=True, sort=False)
+    table = pd.DataFrame({'Última muestra': grouped['FECHA'].max().dt.date})
+    for window in windows:
+        recent = daily[daily['FECHA'] > as_of - pd.Timedelta(days=window)]
+        counts = recent.groupby(group_col, observed=True, sort=False)[['Muestras', 'Positivos']].sum()
+        counts = counts.reindex(table.index, fill_value=0)
+        table[f'Muestras {window}d'] = counts['Muestras'].to_numpy()
+        table[f'Positivos {window}d'] = counts['Positivos'].to_numpy()
+        table[f'Tasa {window}d (%)'] = _rate(counts['Positivos'].to_numpy(), counts['Muestras'].to_numpy())
+
+    main = windows[0]
+    enough = table[f'Muestras {main}d'] >= min_samples
+    table['Alerta'] = enough & (table[f'Tasa {main}d (%)'] >= threshold)
+    table = table.assign(_orden=table[f'Tasa {main}d (%)'].where(enough))
+    table = table.sort_values(['Alerta', '_orden'], ascending=False, na_position='last', kind='stable')
+    return table.drop(columns='_orden').rename_axis(group_col).reset_index()